@@ -0,0 +1,2 @@
+# Headless benchmarks for config.py: python -m bench.run from the config dir.
+# Nothing in here is imported by the config itself.
@@ -0,0 +1,282 @@
+"""A qtile backend with no display behind it.
+
+``FakeCore`` is enough for ``libqtile.core.manager.Qtile`` to load the config,
+build the groups, screens and bars and manage windows. Bars draw with the
+real pango/cairo code; a drawer's output is copied into an in-memory image
+where the X11 backend would copy it to a window. ``FakeWindow`` is a client
+with a settable wm_class and title that records where layouts place it.
+"""
+
+import contextlib
+import itertools
+
+import cairocffi
+from libqtile.backend import base
+
+_wids = itertools.count(1)
+
+
+def _noop(*args, **kwargs):
+    pass
+
+
+class FakeCore(base.Core):
+    def __init__(self, screens=((0, 0, 1920, 1080),)):
+        self.screens = list(screens)
+        self.painter = None
+        self.qtile = None
+
+    @property
+    def name(self):
+        return "fake"
+
+    @property
+    def display_name(self):
+        return ":bench"
+
+    def finalize(self):
+        pass
+
+    def setup_listener(self, qtile):
+        self.qtile = qtile
+
+    def remove_listener(self):
+        pass
+
+    def get_screen_info(self):
+        return self.screens
+
+    def grab_key(self, key):
+        return hash(key.key), hash(frozenset(key.modifiers))
+
+    def ungrab_key(self, key):
+        return hash(key.key), hash(frozenset(key.modifiers))
+
+    def ungrab_keys(self):
+        pass
+
+    def grab_button(self, mouse):
+        return hash(mouse.button)
+
+    def ungrab_buttons(self):
+        pass
+
+    def grab_pointer(self):
+        pass
+
+    def ungrab_pointer(self):
+        pass
+
+    @contextlib.contextmanager
+    def masked(self):
+        yield
+
+    def create_internal(self, x, y, width, height):
+        return FakeInternal(self.qtile, x, y, width, height)
+
+    def keysym_from_name(self, name):
+        return hash(name)
+
+
+class FakeDrawer(base.Drawer):
+    """Paints into an image surface the way the X11 drawer paints its pixmap."""
+
+    def __init__(self, qtile, win, width, height):
+        base.Drawer.__init__(self, qtile, win, width, height)
+        self._image = None
+
+    def _draw(self, offsetx=0, offsety=0, width=None, height=None):
+        self.current_rect = (offsetx, offsety, width, height)
+        if self._image is None:
+            self._image = cairocffi.ImageSurface(
+                cairocffi.FORMAT_ARGB32, max(1, self.width), max(1, self.height)
+            )
+        if self.needs_update:
+            ctx = cairocffi.Context(self._image)
+            ctx.set_source_surface(self.surface, 0, 0)
+            ctx.paint()
+            self.previous_rect = self.current_rect
+        # Stands in for CopyArea onto the window.
+        ctx = cairocffi.Context(self._win.image)
+        ctx.set_source_surface(self._image, offsetx, offsety)
+        ctx.rectangle(
+            offsetx,
+            offsety,
+            self.width if width is None else width,
+            self.height if height is None else height,
+        )
+        ctx.fill()
+
+    @property
+    def width(self):
+        return self._width
+
+    @width.setter
+    def width(self, width):
+        if width > self._width:
+            self._image = None
+        self._width = width
+
+    @property
+    def height(self):
+        return self._height
+
+    @height.setter
+    def height(self, height):
+        if height > self._height:
+            self._image = None
+        self._height = height
+
+
+class FakeInternal(base.Internal):
+    def __init__(self, qtile, x, y, width, height):
+        base.Internal.__init__(self)
+        self.qtile = qtile
+        self._wid = next(_wids)
+        self.x, self.y, self.width, self.height = x, y, width, height
+        self.hidden = True
+        self._opacity = 1.0
+        self.image = cairocffi.ImageSurface(cairocffi.FORMAT_ARGB32, width, height)
+
+    @property
+    def wid(self):
+        return self._wid
+
+    def hide(self):
+        self.hidden = True
+
+    def unhide(self):
+        self.hidden = False
+
+    def kill(self):
+        pass
+
+    def place(
+        self,
+        x,
+        y,
+        width,
+        height,
+        borderwidth,
+        bordercolor,
+        above=False,
+        margin=None,
+        respect_hints=False,
+    ):
+        if (width, height) != (self.width, self.height):
+            self.image = cairocffi.ImageSurface(cairocffi.FORMAT_ARGB32, width, height)
+        self.x, self.y, self.width, self.height = x, y, width, height
+
+    def info(self):
+        return dict(
+            name=self.name, x=self.x, y=self.y, width=self.width, height=self.height, id=self.wid
+        )
+
+    def create_drawer(self, width, height):
+        return FakeDrawer(self.qtile, self, width, height)
+
+
+class FakeWindow(base.Window):
+    """A client window. Anything a backend would send to the server is a no-op."""
+
+    def __init__(self, qtile, wm_class, name=None, role=None):
+        base.Window.__init__(self)
+        self.qtile = qtile
+        self._wid = next(_wids)
+        self._group = None
+        self._wm_class = wm_class
+        self._role = role
+        self.name = name or wm_class[-1]
+        self.x = self.y = 0
+        self.width, self.height = 640, 480
+        self.float_x = self.float_y = None
+        self.bordercolor = None
+        self._opacity = 1.0
+        self.hidden = True
+        self.places = 0
+
+    @property
+    def wid(self):
+        return self._wid
+
+    @property
+    def group(self):
+        return self._group
+
+    @group.setter
+    def group(self, group):
+        self._group = group
+
+    def get_wm_class(self):
+        return self._wm_class
+
+    def get_wm_role(self):
+        return self._role
+
+    def get_pid(self):
+        return 0
+
+    def hide(self):
+        self.hidden = True
+
+    def unhide(self):
+        self.hidden = False
+
+    def place(
+        self,
+        x,
+        y,
+        width,
+        height,
+        borderwidth,
+        bordercolor,
+        above=False,
+        margin=None,
+        respect_hints=False,
+    ):
+        if margin is not None:
+            if isinstance(margin, int):
+                margin = [margin] * 4
+            x += margin[3]
+            y += margin[0]
+            width -= margin[1] + margin[3]
+            height -= margin[0] + margin[2]
+        self.x, self.y, self.width, self.height = x, y, width, height
+        self.borderwidth = borderwidth
+        self.bordercolor = bordercolor
+        self.places += 1
+
+    def info(self):
+        return dict(
+            name=self.name,
+            x=self.x,
+            y=self.y,
+            width=self.width,
+            height=self.height,
+            group=self.group.name if self.group else None,
+            id=self.wid,
+            wm_class=self._wm_class,
+        )
+
+    def focus(self, warp):
+        self.qtile.core.focused = self
+
+    def togroup(self, group_name=None, *, switch_group=False, toggle=False):
+        group = self.qtile.groups_map[group_name] if group_name else self.qtile.current_group
+        if self.group is not group:
+            self.hide()
+            if self.group is not None:
+                self.group.remove(self)
+            group.add(self)
+        if switch_group:
+            group.cmd_toscreen(toggle=toggle)
+
+
+# The rest of the abstract window API (cmd_* and friends) isn't reached by
+# anything the benchmarks do; make it a no-op rather than spell it all out.
+for _name in FakeWindow.__abstractmethods__:
+    setattr(FakeWindow, _name, _noop)
+FakeWindow.__abstractmethods__ = frozenset()
+for _name in FakeInternal.__abstractmethods__:
+    setattr(FakeInternal, _name, _noop)
+FakeInternal.__abstractmethods__ = frozenset()
@@ -0,0 +1,120 @@
+"""Stand-ins for everything the bar reads from the system.
+
+``FakeInputs(root)`` builds, under ``root``:
+
+* ``bin/pactl``: volume 50%, unmuted, and a ``subscribe`` that stays quiet
+  (``PactlVolume`` replaced the old ``pamixer`` polling, so pactl is what
+  the bar runs now);
+* ``bin/checkupdates``: three pending updates;
+* ``proc/uptime``: a fixed uptime for ``Uptime``;
+* ``sys/class/power_supply/BAT0`` and ``sys/class/backlight/<name>``: plain
+  files laid out like sysfs.
+
+``point_widgets(screens)`` then points the config's widgets at them, so
+every run reads the same values whatever machine it is on.
+"""
+
+import os
+import stat
+
+PACTL = """#!/bin/sh
+case "$1" in
+    get-sink-volume)
+        echo "Volume: front-left: 32768 /  50% / -18.06 dB,   front-right: 32768 /  50%"
+        ;;
+    get-sink-mute) echo "Mute: no" ;;
+    subscribe) exec sleep 86400 ;;
+esac
+"""
+
+CHECKUPDATES = """#!/bin/sh
+echo "linux 6.1.1.arch1-1 -> 6.1.2.arch1-1"
+echo "mesa 22.3.1-1 -> 22.3.2-1"
+echo "qtile 0.21.0-3 -> 0.22.1-1"
+"""
+
+BATTERY = {
+    "present": "1",
+    "status": "Discharging",
+    "capacity": "73",
+    "energy_now": "36500000",
+    "energy_full": "50000000",
+    "power_now": "7300000",
+    "voltage_now": "11400000",
+}
+
+_CONFIG_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ICON = os.path.join(_CONFIG_DIR, "icons", "python.png")
+
+
+def _write(path, content, executable=False):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(content)
+    if executable:
+        os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+
+
+class FakeInputs:
+    def __init__(self, root, backlight_name="amdgpu_bl1"):
+        self.root = root
+        self.bin = os.path.join(root, "bin")
+        self.uptime = os.path.join(root, "proc", "uptime")
+        self.power_supply = os.path.join(root, "sys", "class", "power_supply")
+        self.backlight = os.path.join(root, "sys", "class", "backlight")
+
+        _write(os.path.join(self.bin, "pactl"), PACTL, executable=True)
+        _write(os.path.join(self.bin, "checkupdates"), CHECKUPDATES, executable=True)
+        _write(self.uptime, "183945.27 1402113.64\n")
+        for name, value in BATTERY.items():
+            _write(os.path.join(self.power_supply, "BAT0", name), value + "\n")
+        device = os.path.join(self.backlight, backlight_name)
+        _write(os.path.join(device, "max_brightness"), "255\n")
+        _write(os.path.join(device, "brightness"), "128\n")
+        _write(os.path.join(device, "actual_brightness"), "128\n")
+
+    def environ(self):
+        """Environment changes for the run: fake binaries first on $PATH."""
+        return {
+            "PATH": self.bin + os.pathsep + os.environ.get("PATH", ""),
+            "XDG_CACHE_HOME": os.path.join(self.root, "cache"),
+        }
+
+    def options(self, widget_name):
+        """Config overrides for a widget class name, or None to drop the widget."""
+        if widget_name == "Systray":
+            # Needs an X connection to embed icons.
+            return None
+        return {
+            "Image": {"filename": ICON},
+            "Uptime": {"path": self.uptime},
+            "PactlVolume": {"pactl": os.path.join(self.bin, "pactl")},
+            "PacmanUpdates": {
+                "command": os.path.join(self.bin, "checkupdates"),
+                "cache_file": os.path.join(self.root, "checkupdates.json"),
+                "trigger_file": os.path.join(self.root, "checkupdates.stamp"),
+            },
+            "EventBattery": {"sysfs_dir": self.power_supply, "battery": "BAT0"},
+            "BacklightWidget": {"sysfs_dir": self.backlight},
+        }.get(widget_name, {})
+
+    def point_widgets(self, screens):
+        for screen in screens:
+            for position in ("top", "bottom", "left", "right"):
+                bar = getattr(screen, position)
+                if bar is None or not hasattr(bar, "widgets"):
+                    continue
+                kept = []
+                for widget in bar.widgets:
+                    # modules.startup.LazyWidget builds the real one from its config.
+                    lazy = hasattr(widget, "widget_name")
+                    options = self.options(widget.widget_name if lazy else type(widget).__name__)
+                    if options is None:
+                        continue
+                    if lazy:
+                        widget._user_config.update(options)
+                    else:
+                        for name, value in options.items():
+                            setattr(widget, name, value)
+                    kept.append(widget)
+                bar.widgets[:] = kept
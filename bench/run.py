@@ -0,0 +1,335 @@
+"""Headless benchmarks for the config's hot paths.
+
+Run from the config dir (qtile must be importable)::
+
+    python -m bench.run -o after.json --compare before.json
+
+``config.py`` is loaded into a real ``libqtile.core.manager.Qtile`` on top of
+``bench.fakecore.FakeCore``, with the widgets pointed at ``bench.inputs``,
+and measured for:
+
+``config_import``
+    ``Config.load()`` of config.py in a fresh interpreter (libqtile's core
+    already imported, as it is when qtile reads the config).
+``follow_window`` / ``manage``
+    bursts of new clients with a mix of routed and unrouted wm_classes: the
+    ``follow_window`` hook alone, then the whole ``Qtile.manage`` path. The
+    run fails if the config's ``GroupRouter`` indexed no wm_class, i.e. every
+    client would go through the linear fallback.
+``toscreen`` / ``nav_toscreen``
+    switching between groups with windows in them, at each group count in
+    ``--groups``: ``group.cmd_toscreen`` and the ``GroupNav`` keys.
+``bar_tick`` / ``bar_draw`` / ``bar_draw_no_skip``
+    one scheduler tick polling every widget, and a full bar redraw with and
+    without ``CachedBar`` skipping unchanged widgets. The run fails if drawing
+    an unchanged widget twice doesn't skip the second draw.
+
+Times include the loop iteration after the call, so redraws it queues are
+counted. Everything is in milliseconds. The JSON also carries the startup
+profile of the run. ``--compare`` prints the change in medians against an
+earlier run and, with ``--max-regression``, fails if any got slower than that.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+CONFIG = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "config.py")
+
+# Routed by the config's groups, then ones no group claims.
+WM_CLASSES = [
+    ("Navigator", "firefox"),
+    ("mpv", "mpv"),
+    ("vlc", "vlc"),
+    ("deadbeef", "deadbeef"),
+    ("virt-manager", "virt-manager"),
+    ("Alacritty", "Alacritty"),
+    ("emacs", "Emacs"),
+    ("gimp", "Gimp"),
+    ("zathura", "Zathura"),
+    ("steamwebhelper", "Steam"),
+    ("pavucontrol", "Pavucontrol"),
+    ("crx_abc", "Google-chrome"),
+]
+
+_IMPORT = """
+import sys, time
+import libqtile.core.manager
+from libqtile import confreader
+start = time.perf_counter()
+confreader.Config(sys.argv[1]).load()
+print((time.perf_counter() - start) * 1000)
+"""
+
+
+def summarize(samples):
+    """Milliseconds from a list of seconds."""
+    ms = sorted(s * 1000 for s in samples)
+    return {
+        "n": len(ms),
+        "median_ms": round(statistics.median(ms), 4),
+        "mean_ms": round(statistics.fmean(ms), 4),
+        "p95_ms": round(ms[min(len(ms) - 1, int(0.95 * len(ms)))], 4),
+        "min_ms": round(ms[0], 4),
+        "max_ms": round(ms[-1], 4),
+    }
+
+
+def _bench_config(inputs):
+    from libqtile import confreader
+
+    class BenchConfig(confreader.Config):
+        def load(self):
+            confreader.Config.load(self)
+            inputs.point_widgets(self.screens)
+
+    return BenchConfig
+
+
+async def start_qtile(config, inputs, settle):
+    from libqtile.core.manager import Qtile
+
+    from bench.fakecore import FakeCore
+
+    core = FakeCore()
+    qtile = Qtile(core, _bench_config(inputs)(config), no_spawn=True)
+    qtile._eventloop = asyncio.get_running_loop()
+    core.setup_listener(qtile)
+    qtile.load_config(initial=True)
+    # First frame, lazy widgets, first polls.
+    await asyncio.sleep(settle)
+    return qtile
+
+
+async def timed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    await asyncio.sleep(0)
+    return time.perf_counter() - start
+
+
+# -- benchmarks ----------------------------------------------------------------
+
+
+def bench_config_import(config, env, runs):
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run(
+            [sys.executable, "-c", _IMPORT, config],
+            env=env,
+            cwd=os.path.dirname(config),
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        samples.append(float(out.stdout.strip().splitlines()[-1]) / 1000)
+    return summarize(samples)
+
+
+async def bench_clients(qtile, rng, bursts, burst_size):
+    from bench.fakecore import FakeWindow
+
+    config = sys.modules["config"]
+    follow_window = config.follow_window
+    router = config.router.sizes()
+    if not router["wm_class"]:
+        raise RuntimeError("GroupRouter indexed no wm_class, every client takes the fallback")
+
+    def client(i):
+        wm_class = rng.choice(WM_CLASSES)
+        return FakeWindow(qtile, list(wm_class), name="{} {}".format(wm_class[1], i))
+
+    follow, manage, unmanage = [], [], []
+    for _ in range(bursts):
+        clients = [client(i) for i in range(burst_size)]
+        for c in clients:
+            follow.append(await timed(follow_window, c))
+        for c in clients:
+            manage.append(await timed(qtile.manage, c))
+        for c in clients:
+            unmanage.append(await timed(qtile.unmanage, c.wid))
+    return {
+        "follow_window": dict(summarize(follow), per_sec=round(len(follow) / sum(follow))),
+        "manage": dict(summarize(manage), per_sec=round(len(manage) / sum(manage))),
+        "unmanage": summarize(unmanage),
+        "router": router,
+    }
+
+
+async def bench_toscreen(qtile, rng, group_counts, windows, switches):
+    from bench.fakecore import FakeWindow
+
+    nav = sys.modules["config"].nav
+    results = {"toscreen": {}, "nav_toscreen": {}}
+    for count in group_counts:
+        for i in range(len(qtile.groups), count):
+            qtile.add_group("b{}".format(i))
+        for group in qtile.groups:
+            while len(group.windows) < windows:
+                win = FakeWindow(qtile, list(rng.choice(WM_CLASSES)))
+                qtile.windows_map[win.wid] = win
+                group.add(win, focus=False)
+        names = [g.name for g in qtile.groups[:count]]
+        order = [rng.choice(names) for _ in range(switches)]
+        results["toscreen"][str(count)] = summarize(
+            [await timed(qtile.groups_map[name].cmd_toscreen) for name in order]
+        )
+        results["nav_toscreen"][str(count)] = summarize(
+            [await timed(nav.toscreen, qtile, name) for name in order]
+        )
+    return results
+
+
+async def bench_bar(qtile, ticks):
+    from modules.scheduler import scheduler
+
+    bar = qtile.screens[0].top
+    tick, draw, draw_all = [], [], []
+    for _ in range(ticks):
+        start = time.perf_counter()
+        await scheduler.poll_all()
+        await asyncio.sleep(0)
+        tick.append(time.perf_counter() - start)
+        draw.append(await timed(bar._actual_draw))
+    results = {"bar_tick": summarize(tick), "bar_draw": summarize(draw)}
+    if hasattr(bar, "cmd_set_skip_unchanged"):
+        # Draw one cached widget twice on its own, so the skip check itself runs.
+        widget = next(w for w in bar.widgets if getattr(w.draw, "__name__", "") == "cached")
+        skipped = bar.cmd_render_stats()["skipped"]
+        widget.draw()
+        widget.draw()
+        if bar.cmd_render_stats()["skipped"] == skipped:
+            raise RuntimeError("bench: CachedBar didn't skip an unchanged " + widget.name)
+        bar.cmd_set_skip_unchanged(False)
+        for _ in range(ticks):
+            draw_all.append(await timed(bar._actual_draw))
+        bar.cmd_set_skip_unchanged(True)
+        results["bar_draw_no_skip"] = summarize(draw_all)
+    results["bar_widgets"] = [w.name for w in bar.widgets]
+    return results
+
+
+async def run_all(args, inputs):
+    rng = random.Random(args.seed)
+    qtile = await start_qtile(args.config, inputs, args.settle)
+    try:
+        results = {}
+        results.update(await bench_bar(qtile, args.ticks))
+        results.update(await bench_clients(qtile, rng, args.bursts, args.burst_size))
+        results.update(
+            await bench_toscreen(qtile, rng, args.groups, args.windows, args.switches)
+        )
+    finally:
+        qtile.finalize()
+    return results
+
+
+# -- reporting -----------------------------------------------------------------
+
+
+def _medians(results, prefix=""):
+    for name, value in results.items():
+        if isinstance(value, dict) and "median_ms" in value:
+            yield prefix + name, value["median_ms"]
+        elif isinstance(value, dict):
+            yield from _medians(value, prefix + name + ".")
+
+
+def compare(baseline, current, max_regression=None):
+    """Print median changes to stderr; False if one is over ``max_regression``."""
+    old = dict(_medians(baseline["results"]))
+    ok = True
+    for name, new in _medians(current["results"]):
+        if name not in old:
+            continue
+        ratio = new / old[name] if old[name] else float("inf")
+        flag = ""
+        if max_regression is not None and ratio > max_regression:
+            flag = "  REGRESSION"
+            ok = False
+        print(
+            "{:40} {:10.3f} -> {:10.3f} ms {:6.2f}x{}".format(name, old[name], new, ratio, flag),
+            file=sys.stderr,
+        )
+    return ok
+
+
+def _version():
+    try:
+        from importlib.metadata import version
+
+        return version("qtile")
+    except Exception:
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--config", default=CONFIG)
+    parser.add_argument("-o", "--output", help="Write the JSON here instead of stdout.")
+    parser.add_argument("--compare", metavar="BASELINE", help="JSON of an earlier run.")
+    parser.add_argument("--max-regression", type=float, help="e.g. 1.2: fail if 20%% slower.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--imports", type=int, default=5, help="config_import runs.")
+    parser.add_argument("--settle", type=float, default=2.0, help="Seconds to wait after start.")
+    parser.add_argument("--ticks", type=int, default=100)
+    parser.add_argument("--bursts", type=int, default=5)
+    parser.add_argument("--burst-size", type=int, default=100)
+    parser.add_argument(
+        "--groups", type=lambda s: [int(n) for n in s.split(",")], default=[9, 25, 50, 100]
+    )
+    parser.add_argument("--windows", type=int, default=3, help="Windows per group.")
+    parser.add_argument("--switches", type=int, default=200)
+    args = parser.parse_args(argv)
+    args.config = os.path.abspath(args.config)
+
+    from bench.inputs import FakeInputs
+
+    with tempfile.TemporaryDirectory(prefix="qtile-bench-") as root:
+        inputs = FakeInputs(root)
+        os.environ.update(inputs.environ())
+        sys.path.insert(0, os.path.dirname(args.config))
+        results = {"config_import": bench_config_import(args.config, os.environ, args.imports)}
+        results.update(asyncio.run(run_all(args, inputs)))
+        startup = None
+        profile = os.path.join(os.environ["XDG_CACHE_HOME"], "qtile", "startup_profile.json")
+        if os.path.exists(profile):
+            with open(profile) as f:
+                startup = {k: v for k, v in json.load(f).items() if k != "records"}
+
+    report = {
+        "schema": 1,
+        "meta": {
+            "python": platform.python_version(),
+            "qtile": _version(),
+            "machine": platform.machine(),
+            "args": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        },
+        "results": results,
+        "startup": startup,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if not compare(baseline, report, args.max_regression):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -24,32 +24,126 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+# Time everything the config does until the bar is on screen; the report
+# goes to the log and ~/.cache/qtile/startup_profile.json.
+from modules.startup import LazyWidget, guess_terminal, profiler
+profiler.start()
+
 from libqtile import bar, layout, widget, hook
 from libqtile.config import Click, Drag, Group, Key, Match, Screen, KeyChord
 from libqtile.lazy import lazy
-from libqtile.utils import guess_terminal
+#from libqtile.utils import guess_terminal
 from libqtile import qtile
 
 import os
-import subprocess
+
+from modules.backlight import BacklightWidget
+from modules.battery import EventBattery
+from modules.emacs import EmacsLauncher, server_socket_path
+from modules.groupnav import GroupNav
+from modules.instrument import Instruments, instruments
+from modules.launcher import ExecutableIndex, LauncherPrompt
+from modules.power import PowerProfiles
+from modules.reload import reloader
+from modules.render import CachedBar, CachedTextBox
+from modules.routing import GroupRouter
+from modules.scheduler import scheduler
+from modules.supervisor import Service, Supervisor, socket_listening
+from modules.updates import PacmanUpdates
+from modules.uptime import Uptime
+from modules.volume import PactlVolume
+from modules.wallpaper import Wallpapers
 
 home = os.path.expanduser('~')
 mod = "mod4"
 terminal = guess_terminal()
 
 
+# Session services, started in parallel once their dependencies are ready.
+# Daemons are restarted with backoff if they die.
+supervisor = Supervisor([
+    Service("nm-applet", ["nm-applet"]),
+    # --fg-daemon stays in the foreground so it can be supervised.
+    # A stale socket file from a crashed daemon doesn't count as ready.
+    Service("emacs", ["/usr/bin/emacs", "--fg-daemon"], ready=socket_listening(server_socket_path())),
+    #Service("wallpaper", ["sh", "-c", 'exec feh --randomize --bg-fill "$HOME"/Pictures/*'], oneshot=True),
+    Service("blueman-applet", ["blueman-applet"]),
+    Service("touchpad-off", ["synclient", "TouchpadOff=1"], oneshot=True),
+    Service("screensaver-off", ["xset", "s", "off"], oneshot=True),
+])
+
 @hook.subscribe.startup_once
 def autostart():
-    subprocess.Popen([home + '/.config/qtile/autostart.sh'])
+    supervisor.start()
+
+# Don't respawn anything while qtile goes down. A restart re-execs qtile
+# without startup_once, so the daemons are left running for it.
+@hook.subscribe.shutdown
+def stop_services():
+    supervisor.stop()
+
+@hook.subscribe.restart
+def stop_supervising():
+    supervisor.stop(terminate=False)
+
+# Opens Emacs frames over the server socket instead of forking emacsclient.
+emacs = EmacsLauncher()
+
+@hook.subscribe.startup
+def warm_emacs():
+    emacs.warm()
+
+# A new wallpaper from ~/Pictures every 30 minutes, pre-scaled to each screen
+# in the background and painted from ~/.cache/qtile/wallpapers.
+wallpapers = Wallpapers(os.path.join(home, "Pictures"), interval=1800)
+
+@hook.subscribe.startup
+def start_wallpapers():
+    wallpapers.start(qtile)
+
+hook.subscribe.screens_reconfigured(wallpapers.screens_changed)
+
+# $PATH index for the run prompt and dmenu, kept current with inotify.
+launcher = ExecutableIndex()
+
+@hook.subscribe.startup
+def index_path():
+    launcher.start()
+
+# Bar refresh profiles: polling widgets slow down on battery and stop while
+# the session is idle or locked, or their bar is hidden. The clock shows no
+# seconds and polls are aligned to wall-clock multiples of the interval, so
+# once a minute still turns it over on the minute.
+power = PowerProfiles(
+    profiles={
+        "performance": {"clock": 60},
+        "balanced": {"default": 2, "clock": 60},
+        "battery": {"default": 5, "cpu": 10, "clock": 60},
+        "idle": {"default": None},
+    },
+    on_ac="performance",
+    on_battery="battery",
+    idle_after=300,
+)
+
+@hook.subscribe.startup
+def start_power():
+    power.start(qtile)
+
+@power.on_change
+def pause_lag_probe(profile):
+    # Nobody is looking while idle; don't wake the loop for the probe at all.
+    if profile == "idle":
+        instruments.stop_lag_probe()
+    else:
+        instruments.start_lag_probe()
 
 @hook.subscribe.client_new
 def follow_window(client):
-    for group in groups:
-        match = next((m for m in group.matches if m.compare(client)), None)
-        if match:
-            targetgroup = client.qtile.groups_map[group.name]
-            targetgroup.cmd_toscreen(toggle=False)
-            break
+    group_name = router.route(client)
+    if group_name is not None:
+        targetgroup = client.qtile.groups_map[group_name]
+        targetgroup.cmd_toscreen(toggle=False)
 
 keys = [
     # A list of available commands that can be bound to keys can be found
@@ -87,22 +181,32 @@ keys = [
     # Toggle between different layouts as defined below
     Key([mod], "Tab", lazy.next_layout(), desc="Toggle between layouts"),
     Key([mod], "w", lazy.window.kill(), desc="Kill focused window"),
-    Key([mod, "control"], "r", lazy.restart(), desc="Reload the config"),
+    Key([mod, "shift"], "w", lazy.function(wallpapers.next), desc="Next wallpaper"),
+    Key([mod, "shift"], "o", lazy.function(power.cycle), desc="Cycle bar refresh profiles"),
+    #Key([mod, "control"], "r", lazy.restart(), desc="Reload the config"),
+    Key([mod, "control"], "r", lazy.function(reloader.reload), desc="Reload the config"),
+    Key([mod, "control", "shift"], "r", lazy.restart(), desc="Restart Qtile"),
     Key([mod, "control"], "q", lazy.shutdown(), desc="Shutdown Qtile"),
-    Key([mod], "r", lazy.spawncmd(), desc="Spawn a command using a prompt widget"),
+    #Key([mod], "r", lazy.spawncmd(), desc="Spawn a command using a prompt widget"),
+    Key([mod], "r", lazy.function(launcher.prompt), desc="Spawn a command using a prompt widget"),
 
     # Brightness Control
     #Key([], "XF86MonBrightnessUp", lazy.spawn("backlight_control +10"), desc="incesase brightness by 10%"),
     #Key([], "XF86MonBrightnessDown", lazy.spawn("backlight_control -10"), desc="descrease brightness by 10%"),
-    Key([], "XF86MonBrightnessUp", lazy.spawn("brightnessctl s 5%+"), desc="incesase brightness by 10%"),
-    Key([], "XF86MonBrightnessDown", lazy.spawn("brightnessctl s 5%-"), desc="descrease brightness by 10%"),
+    #Key([], "XF86MonBrightnessUp", lazy.spawn("brightnessctl s 5%+"), desc="incesase brightness by 10%"),
+    #Key([], "XF86MonBrightnessDown", lazy.spawn("brightnessctl s 5%-"), desc="descrease brightness by 10%"),
+    Key([], "XF86MonBrightnessUp", lazy.widget["backlight"].change_backlight(5), desc="Increase brightness by 5%"),
+    Key([], "XF86MonBrightnessDown", lazy.widget["backlight"].change_backlight(-5), desc="Decrease brightness by 5%"),
 
     # Volume control
     #Key([], "XF86AudioRaiseVolume", lazy.spawn("pactl set-sink-volume @DEFAULT_SINK@ +5%"), desc="incesase brightness by 10%"),
     #Key([], "XF86AudioLowerVolume", lazy.spawn("pactl set-sink-volume @DEFAULT_SINK@ -5%"), desc="descrease brightness by 10%"),
-    Key([], "XF86AudioRaiseVolume", lazy.spawn("pamixer -i 5"), desc="incesase brightness by 10%"),
-    Key([], "XF86AudioLowerVolume", lazy.spawn("pamixer -d 5"), desc="descrease brightness by 10%"),
-    Key([], "XF86AudioMute", lazy.spawn("pamixer -t"), desc="descrease brightness by 10%"),
+    #Key([], "XF86AudioRaiseVolume", lazy.spawn("pamixer -i 5"), desc="incesase brightness by 10%"),
+    #Key([], "XF86AudioLowerVolume", lazy.spawn("pamixer -d 5"), desc="descrease brightness by 10%"),
+    #Key([], "XF86AudioMute", lazy.spawn("pamixer -t"), desc="descrease brightness by 10%"),
+    Key([], "XF86AudioRaiseVolume", lazy.widget["volume"].increase_vol(), desc="Raise volume by 5%"),
+    Key([], "XF86AudioLowerVolume", lazy.widget["volume"].decrease_vol(), desc="Lower volume by 5%"),
+    Key([], "XF86AudioMute", lazy.widget["volume"].mute(), desc="Toggle mute"),
 
 
     # Launch pcmanfm
@@ -119,7 +223,9 @@ keys = [
     Key([mod], "b", lazy.spawn("firefox"), desc="Launch Firefox Browser"),
 
     # Launch Dmenu
-    Key([mod, "shift"], "p", lazy.spawn("dmenu_run -p 'Run: '"),
+    #Key([mod, "shift"], "p", lazy.spawn("dmenu_run -p 'Run: '"),
+    #    desc='Run Launcher'),
+    Key([mod, "shift"], "p", lazy.function(launcher.dmenu, "-p", "Run: "),
         desc='Run Launcher'),
 
     # Launch archlinux-logout
@@ -127,14 +233,14 @@ keys = [
 
     # Emacs programs launched using the key chord mod+e followed by 'key'
     KeyChord([mod], "e", [
-        Key([], "e", lazy.spawn("emacsclient -c -a 'emacs'")),
-        Key([], "b", lazy.spawn("emacsclient -c -a 'emacs' --eval '(ibuffer)'"), desc="Launch ibuffer"),
-        Key([], "d", lazy.spawn("emacsclient -c -a 'emacs' --eval '(dired nil)'"), desc='Launch dired inside Emacs'),
-        Key([], "i", lazy.spawn("emacsclient -c -a 'emacs' --eval '(erc)'"), desc='Launch erc inside Emacs'),
-        Key([], "m", lazy.spawn("emacsclient -c -a 'emacs' --eval '(mu4e)'"), desc='Launch mu4e inside Emacs'),
-        Key([], "n", lazy.spawn("emacsclient -c -a 'emacs' --eval '(elfeed)'"), desc='Launch elfeed inside Emacs'),
-        Key([], "s", lazy.spawn("emacsclient -c -a 'emacs' --eval '(eshell)'"), desc='Launch the eshell inside Emacs'),
-        Key([], "v", lazy.spawn("emacsclient -c -a 'emacs' --eval '(+vterm/here nil)'"), desc='Launch vterm inside Emacs'),
+        Key([], "e", lazy.function(emacs.frame, key="e"), desc='Launch an Emacs frame'),
+        Key([], "b", lazy.function(emacs.frame, "(ibuffer)", key="b"), desc="Launch ibuffer"),
+        Key([], "d", lazy.function(emacs.frame, "(dired nil)", key="d"), desc='Launch dired inside Emacs'),
+        Key([], "i", lazy.function(emacs.frame, "(erc)", key="i"), desc='Launch erc inside Emacs'),
+        Key([], "m", lazy.function(emacs.frame, "(mu4e)", key="m"), desc='Launch mu4e inside Emacs'),
+        Key([], "n", lazy.function(emacs.frame, "(elfeed)", key="n"), desc='Launch elfeed inside Emacs'),
+        Key([], "s", lazy.function(emacs.frame, "(eshell)", key="s"), desc='Launch the eshell inside Emacs'),
+        Key([], "v", lazy.function(emacs.frame, "(+vterm/here nil)", key="v"), desc='Launch vterm inside Emacs'),
         ]),
 
     # Dmenu Propmpts
@@ -195,21 +301,26 @@ groups = [
     Group("9", matches = [Match(wm_class=[""])]),
 ]
 
-def toscreen(qtile, group_name):
-    if group_name  == qtile.current_screen.group.name:
-        qtile.current_screen.set_group(qtile.current_screen.previous_group)
-    else:
-        for i in range(len(qtile.groups)):
-            if group_name == qtile.groups[i].name:
-                qtile.current_screen.set_group(qtile.groups[i])
-                break
+# follow_window routes new clients through this index instead of scanning
+# every group's matches.
+router = GroupRouter(groups)
+
+# Group switching with per-screen MRU history; pressing the key of the group
+# that's already shown goes back to the previous one.
+nav = GroupNav()
+hook.subscribe.setgroup(nav.record)
+
+keys.extend([
+    Key([mod], "grave", lazy.function(nav.cycle), desc="Cycle through recently used groups"),
+    Key([mod, "shift"], "grave", lazy.function(nav.back, 2), desc="Go back two groups"),
+])
 
 for i in groups:
     keys.extend([
         # mod1 + letter of group = switch to group
         # Key([mod]), i.name, lazy.group[i.name].toscreen(),
         # switch to group with ability to go to previous group if pressed again
-        Key([mod], i.name, lazy.function(toscreen, i.name),
+        Key([mod], i.name, lazy.function(nav.toscreen, i.name),
             desc="Switch to & move focused window to group {}".format(i.name)),
 
         #mod1 + shift + letter of group = switch to & move focused window to group
@@ -258,14 +369,15 @@ extension_defaults = widget_defaults.copy()
 
 screens = [
     Screen(
-        top=bar.Bar(
+        top=CachedBar(
             [
                 widget.Sep(
                     linewidth = 0,
                     padding = 6,
                     foreground = colors[2],
                     background = colors[0]),
-                widget.Image(
+                LazyWidget(
+                    "Image",
                     filename = '~/.config/qtile/icons/python.png',
                     scale = 'False',
                     mouse_callbacks = {'Button1': lambda: qtile.cmd_spawn(terminal)}
@@ -289,7 +401,9 @@ screens = [
                     other_screen_border = colors[4],
                     foreground = colors[2],
                     background = colors[0]),
-                widget.Prompt(
+                LauncherPrompt(
+                    name = "prompt",
+                    index = launcher,
                     font = 'Source Code Pro',
                     padding = 10,
                     fontsize = 14,),
@@ -308,108 +422,109 @@ screens = [
                 ),
                 #widget.TextBox("default config", name="default"),
                 #widget.TextBox("Press &lt;M-r&gt; to spawn", foreground="#d75f5f"),
-                 widget.TextBox(
+                 CachedTextBox(
                     text = '',
                     #background = colors[0],
                     foreground = colors[5],
                     padding = 0,
                     fontsize = 37),
-                widget.TextBox(
+                CachedTextBox(
                     text = 'Uptime:',
                     background = colors[5],
                     foreground = colors[1],
                     fontsize = 14
                 ),
-                widget.GenPollText(
-                    update_interval = 1,
-                    func = lambda: subprocess.check_output(os.path.expanduser(home + "/.local/bin/upt")).decode('utf-8').strip(),
+                Uptime(
                     background = colors[5],
                     foreground = colors[1],
                     fontsize = 14,),
-               widget.TextBox(
+               CachedTextBox(
                     text = '',
                     background = colors[5],
                     foreground = colors[4],
                     padding = 0,
                     fontsize = 37),
-                widget.CPU(
+                LazyWidget(
+                    "CPU",
                     foreground = colors[1],
                     background = colors[4],
                     threshold = 98,
                     padding = 5,
                     update_interval = 1.0,
                     fontsize = 14,),
-               widget.TextBox(
+               CachedTextBox(
                     text = '',
                     background = colors[4],
                     foreground = colors[5],
                     padding = 0,
                     fontsize = 37),
-                widget.CheckUpdates(
-                    displaay_format = '{updates}',
-                    distro = 'Arch_checkupdates',
-                    color_have_update=colors[3],
-                    color_no_update=colors[1],
-                    mouse_callbacks = {'Button1': lambda: qtile.cmd_spawn(terminal + ' -e sudo pacman -Syu')},
+                PacmanUpdates(
+                    display_format = '{updates}',
+                    command = 'checkupdates',
+                    colour_have_updates = colors[3],
+                    colour_no_updates = colors[1],
+                    execute = terminal + ' -e sudo pacman -Syu',
                     update_interval = 3600,
                     background = colors[5],
                     foreground = colors[1],
                     fontsize = 14,),
-                widget.TextBox(
+                CachedTextBox(
                     text = '',
                     background = colors[5],
                     foreground = colors[4],
                     padding = 0,
                     fontsize = 37),
-                widget.GenPollText(
-                    update_interval = 1,
-                    func = lambda: subprocess.check_output(os.path.expanduser(home + "/.local/bin/vol")).decode('utf-8').strip(),
+                PactlVolume(
+                    name = "volume",
+                    step = 5,
                     background = colors[4],
                     foreground = colors[1],
                     fontsize = 14,
                 ),
-                widget.TextBox(
+                CachedTextBox(
                     text = '',
                     background = colors[4],
                     foreground = colors[5],
                     padding = 0,
                     fontsize = 37),
-                widget.TextBox(
+                CachedTextBox(
                     text = 'Barightness:',
                     background = colors[5],
                     foreground = colors[1],
                     fontsize = 14,
                 ),
-                widget.Backlight(
+                LazyWidget(
+                    BacklightWidget,
+                    name = "backlight",
                     backlight_name = 'amdgpu_bl1',
                     format = '{percent:2.0%}',
                     foreground = colors[1],
                     background = colors[5],
                     fontsize = 14,
                     ),
-                widget.TextBox(
+                CachedTextBox(
                     text = '',
                     background = colors[5],
                     foreground = colors[4],
                     padding = 0,
                     fontsize = 37
                 ),
-                widget.TextBox(
+                CachedTextBox(
                     text = 'Bat:',
                     background = colors[4],
                     foreground = colors[1],
                     fontsize = 14,
                 ),
-                widget.Battery(
+                LazyWidget(
+                    EventBattery,
                     charge_char = 'CHG',
                     discharge_char = 'DIS',
-                    update_interval = 0.2,
                     format = '{char}->{percent:2.0%}',
                     foreground = colors[1],
                     background = colors[4],
                     fontsize = 14,
                     ),
-                widget.TextBox(
+                CachedTextBox(
                     text = '',
                     background = colors[4],
                     foreground = colors[5],
@@ -422,7 +537,7 @@ screens = [
                     foreground=colors[1],
                     fontsize=14,
                 ),
-                widget.TextBox(
+                CachedTextBox(
                     text = '',
                     background = colors[5],
                     foreground = colors[4],
@@ -435,7 +550,15 @@ screens = [
                     padding=5,
                     fontsize=14,
                 ),
-                widget.Systray(
+                Instruments(
+                    format="lag {lag_p95:.0f}ms",
+                    foreground=colors[1],
+                    background=colors[4],
+                    padding=5,
+                    fontsize=14,
+                ),
+                LazyWidget(
+                    "Systray",
                     padding=1,
                     fontsize=14,
                     background=colors[0],
@@ -449,6 +572,18 @@ screens = [
     ),
 ]
 
+# Hand every polling widget's timer to the shared scheduler so they wake up
+# together and the bar is drawn at most once per tick. The clock must not back off.
+scheduler.manage_all(screens[0].top.widgets, steady=("clock",))
+
+# Time hooks, lazy.function keys and widget polls/draws, and warn about
+# anything blocking the loop for over 50ms. Numbers:
+#   qtile cmd-obj -o widget instruments -f stats
+instruments.install(screens, keys)
+
+# Widgets in LazyWidget(...) above are only built once the bar has drawn.
+profiler.config_loaded(screens)
+
 # Drag floating layouts.
 mouse = [
     Drag([mod], "Button1", lazy.window.set_position_floating(), start=lazy.window.get_position()),
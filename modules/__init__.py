@@ -0,0 +1,2 @@
+# Helper modules for the qtile config. Everything in here is imported from
+# config.py; the package lives next to it so qtile finds it on sys.path.
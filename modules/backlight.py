@@ -0,0 +1,166 @@
+import os
+import shlex
+import subprocess
+
+from libqtile.log_utils import logger
+from libqtile.widget import base
+
+from modules.inotify import IN_CLOSE_WRITE, IN_MODIFY, Inotify
+
+BACKLIGHT_DIR = "/sys/class/backlight"
+
+
+class BacklightController:
+    """Keeps the sysfs files of one backlight device open.
+
+    ``brightness`` is opened once (read-write if the udev rules allow it) and
+    ``max_brightness`` is read once. Changes are written straight to the open
+    fd and pushed to every subscriber at once. If the file isn't writable,
+    ``fallback_command`` is spawned instead, without waiting for it.
+
+    Changes made by firmware, hotkeys or other programs are announced by the
+    kernel with ``sysfs_notify`` on ``actual_brightness`` (plain sysfs
+    attributes raise no inotify events, but notified ones do), so that file
+    is the one watched and read back.
+    """
+
+    def __init__(
+        self,
+        name,
+        sysfs_dir=BACKLIGHT_DIR,
+        fallback_command="brightnessctl -q -d {name} s {value}",
+    ):
+        self.name = name
+        self.path = os.path.join(sysfs_dir, name)
+        self.fallback_command = fallback_command
+        with open(os.path.join(self.path, "max_brightness")) as f:
+            self.max_brightness = int(f.read())
+        brightness = os.path.join(self.path, "brightness")
+        try:
+            self._fd = os.open(brightness, os.O_RDWR | os.O_CLOEXEC)
+            self.writable = True
+        except PermissionError:
+            self._fd = os.open(brightness, os.O_RDONLY | os.O_CLOEXEC)
+            self.writable = False
+        self._actual_path = os.path.join(self.path, "actual_brightness")
+        try:
+            self._actual_fd = os.open(self._actual_path, os.O_RDONLY | os.O_CLOEXEC)
+        except FileNotFoundError:
+            # Not every fake tree has it; real devices always do.
+            self._actual_path = brightness
+            self._actual_fd = self._fd
+        self._listeners = []
+        self._inotify = None
+        self.brightness = self._read()
+
+    def _read(self):
+        # Only the first line: a plain file standing in for sysfs keeps
+        # leftovers of longer values after a pwrite.
+        return int(os.pread(self._actual_fd, 32, 0).split(b"\n", 1)[0])
+
+    @property
+    def percent(self):
+        return self.brightness / self.max_brightness if self.max_brightness else 0.0
+
+    def subscribe(self, callback):
+        """Call ``callback(controller)`` whenever the brightness changes."""
+        self._listeners.append(callback)
+
+    def _notify(self):
+        for callback in self._listeners:
+            callback(self)
+
+    def watch(self):
+        """Start following external changes; needs the running event loop."""
+        self._inotify = Inotify(self._on_change)
+        self._inotify.add_watch(self._actual_path, IN_MODIFY | IN_CLOSE_WRITE)
+        self._inotify.start()
+
+    def _on_change(self, events):
+        try:
+            value = self._read()
+        except (OSError, ValueError):
+            return
+        # Our own writes come back through here too; only real changes notify.
+        if value != self.brightness:
+            self.brightness = value
+            self._notify()
+
+    def set(self, value):
+        value = max(0, min(int(value), self.max_brightness))
+        if value == self.brightness:
+            return
+        if self.writable:
+            os.pwrite(self._fd, b"%d\n" % value, 0)
+        else:
+            command = self.fallback_command.format(name=self.name, value=value)
+            subprocess.Popen(shlex.split(command))
+        self.brightness = value
+        self._notify()
+
+    def change(self, step):
+        """Change brightness by ``step`` percent of the maximum, like ``brightnessctl s 5%+``."""
+        self.set(self.brightness + round(self.max_brightness * step / 100))
+
+    def close(self):
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
+        if self._actual_fd != self._fd:
+            os.close(self._actual_fd)
+        os.close(self._fd)
+
+
+class BacklightWidget(base._TextBox):
+    """Shows and changes the brightness through a ``BacklightController``.
+
+    Brightness keys bound to ``change_backlight`` write the new value and
+    redraw in the same callback; there is no polling.
+    """
+
+    orientations = base.ORIENTATION_HORIZONTAL
+    defaults = [
+        ("backlight_name", "acpi_video0", "Name of the device in /sys/class/backlight."),
+        ("sysfs_dir", BACKLIGHT_DIR, "Directory holding the backlight devices."),
+        ("format", "{percent:2.0%}", "Display format."),
+        ("step", 5, "Percent to change per mouse scroll."),
+    ]
+
+    def __init__(self, **config):
+        base._TextBox.__init__(self, "", **config)
+        self.add_defaults(BacklightWidget.defaults)
+        self.controller = None
+        self.add_callbacks(
+            {
+                "Button4": lambda: self.cmd_change_backlight(self.step),
+                "Button5": lambda: self.cmd_change_backlight(-self.step),
+            }
+        )
+
+    def timer_setup(self):
+        try:
+            self.controller = BacklightController(self.backlight_name, self.sysfs_dir)
+        except (OSError, ValueError) as e:
+            logger.exception("Unable to open backlight %s", self.backlight_name)
+            self.update("Error: {}".format(e.strerror if isinstance(e, OSError) else e))
+            return
+        self.controller.subscribe(self._show)
+        try:
+            self.controller.watch()
+        except OSError:
+            logger.warning("Backlight: inotify unavailable, external changes won't show")
+        self._show(self.controller)
+
+    def _show(self, controller):
+        self.update(self.format.format(percent=controller.percent))
+
+    def cmd_change_backlight(self, step):
+        """Change the brightness by ``step`` percent (negative to dim)."""
+        if self.controller is not None:
+            self.controller.change(step)
+
+    def finalize(self):
+        if self.controller is not None:
+            self.controller.close()
+            self.controller = None
+        base._TextBox.finalize(self)
@@ -0,0 +1,188 @@
+import asyncio
+import socket
+import time
+
+from libqtile.log_utils import logger
+from libqtile.widget.battery import Battery, _LinuxBattery
+
+from modules.inotify import IN_CLOSE_WRITE, IN_CREATE, IN_MODIFY, IN_MOVED_TO, Inotify
+
+SYSFS_POWER_SUPPLY = "/sys/class/power_supply"
+NETLINK_KOBJECT_UEVENT = 15
+
+
+class EventBattery(Battery):
+    """``Battery`` that redraws on power_supply events instead of polling.
+
+    Event sources, in the order ``events="auto"`` tries them:
+
+    * ``netlink``: kernel uevents for the power_supply subsystem, which arrive
+      as soon as the charger is (un)plugged or the driver reports a change;
+    * ``inotify``: a file watch on the battery directory. Real sysfs attributes
+      don't raise inotify events, so this is for a fake tree set with
+      ``sysfs_dir`` (and is what ``auto`` picks for one);
+    * ``poll``: reads only the status file, off the event loop, and does a
+      full re-read (and possibly a redraw) when it changes. The check runs
+      every ``poll_interval`` seconds after a change and backs off, doubling
+      up to ``max_poll_interval``, while the status stays the same.
+
+    Not every driver emits a uevent per percent, so the full status is also
+    re-read every ``refresh_interval`` seconds.
+    """
+
+    # Battery.__init__ adds ``self.defaults``, so this has to carry its
+    # defaults too.
+    defaults = Battery.defaults + [
+        ("update_interval", None, "Unused, updates are driven by power_supply events."),
+        ("sysfs_dir", SYSFS_POWER_SUPPLY, "Directory holding the power_supply devices."),
+        ("events", "auto", "Event source: 'netlink', 'inotify', 'poll' or 'auto'."),
+        ("refresh_interval", 60, "Seconds between full re-reads regardless of events."),
+        ("poll_interval", 1, "Seconds between status checks when falling back to polling."),
+        ("max_poll_interval", 8, "Longest gap between status checks while the status is steady."),
+    ]
+
+    def __init__(self, **config):
+        Battery.__init__(self, **config)
+        self.event_source = None
+        self._socket = None
+        self._inotify = None
+        self._refreshing = False
+        self._refresh_again = False
+        self._last_status = None
+        self._last_full = 0.0
+        self._poll_delay = None
+        self._closed = False
+
+    @staticmethod
+    def _load_battery(**config):
+        battery = _LinuxBattery(**config)
+        sysfs_dir = config.get("sysfs_dir", SYSFS_POWER_SUPPLY)
+        if sysfs_dir != battery.BAT_DIR:
+            battery.BAT_DIR = sysfs_dir
+            if "battery" not in config:
+                battery.battery = battery._get_battery_name()
+        return battery
+
+    def timer_setup(self):
+        self.refresh()
+        if self.events != "auto":
+            sources = [self.events]
+        elif self.sysfs_dir == SYSFS_POWER_SUPPLY:
+            sources = ["netlink", "poll"]
+        else:
+            sources = ["inotify", "poll"]
+
+        for source in sources:
+            try:
+                getattr(self, "_start_" + source)()
+            except OSError as e:
+                logger.warning("Battery: %s events unavailable: %s", source, e)
+                continue
+            self.event_source = source
+            break
+
+    def _start_netlink(self):
+        sock = socket.socket(
+            socket.AF_NETLINK,
+            socket.SOCK_DGRAM | socket.SOCK_NONBLOCK | socket.SOCK_CLOEXEC,
+            NETLINK_KOBJECT_UEVENT,
+        )
+        try:
+            # Group 1 is the kernel's uevent broadcast group.
+            sock.bind((0, 1))
+        except OSError:
+            sock.close()
+            raise
+        self._socket = sock
+        asyncio.get_running_loop().add_reader(sock.fileno(), self._on_uevent)
+        self.timeout_add(self.refresh_interval, self._periodic)
+
+    def _start_inotify(self):
+        self._inotify = Inotify(lambda events: self.refresh())
+        self._inotify.add_watch(
+            "{}/{}".format(self.sysfs_dir, self._battery.battery),
+            IN_MODIFY | IN_CLOSE_WRITE | IN_CREATE | IN_MOVED_TO,
+        )
+        self._inotify.start()
+        self.timeout_add(self.refresh_interval, self._periodic)
+
+    def _start_poll(self):
+        self._poll_status()
+
+    def _on_uevent(self):
+        relevant = False
+        while True:
+            try:
+                data = self._socket.recv(8192)
+            except BlockingIOError:
+                break
+            relevant = relevant or b"\0SUBSYSTEM=power_supply\0" in data
+        if relevant:
+            self.refresh()
+
+    def _periodic(self):
+        self.refresh()
+        self.timeout_add(self.refresh_interval, self._periodic)
+
+    def _read_status(self):
+        try:
+            return self._battery._get_param("status_file")[0]
+        except RuntimeError:
+            return None
+
+    def _poll_status(self):
+        future = self.qtile.run_in_executor(self._read_status)
+        future.add_done_callback(self._status_read)
+
+    def _status_read(self, future):
+        if self._closed:
+            return
+        try:
+            status = future.result()
+        except Exception:
+            logger.exception("Battery: failed to read status")
+            status = self._last_status
+        if status != self._last_status:
+            self._last_status = status
+            self._poll_delay = self.poll_interval
+            self.refresh()
+        else:
+            if time.monotonic() - self._last_full >= self.refresh_interval:
+                self.refresh()
+            if self._poll_delay is None:
+                self._poll_delay = self.poll_interval
+            else:
+                self._poll_delay = min(self._poll_delay * 2, self.max_poll_interval)
+        self.timeout_add(self._poll_delay, self._poll_status)
+
+    def refresh(self):
+        """Re-read the battery off the event loop and redraw if the text changed."""
+        if self._refreshing:
+            self._refresh_again = True
+            return
+        self._refreshing = True
+        self._last_full = time.monotonic()
+        # Some ACPI batteries are slow to read, keep it off the event loop.
+        future = self.qtile.run_in_executor(self.poll)
+        future.add_done_callback(self._refreshed)
+
+    def _refreshed(self, future):
+        self._refreshing = False
+        try:
+            self.update(future.result())
+        except Exception:
+            logger.exception("Battery: failed to read status")
+        if self._refresh_again:
+            self._refresh_again = False
+            self.refresh()
+
+    def finalize(self):
+        self._closed = True
+        if self._socket is not None:
+            asyncio.get_event_loop().remove_reader(self._socket.fileno())
+            self._socket.close()
+            self._socket = None
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
+        Battery.finalize(self)
@@ -0,0 +1,180 @@
+"""Talk to the Emacs server socket directly instead of forking emacsclient.
+
+Each request is what ``emacsclient -c -n [--eval EXPR]`` would send, written
+over a unix socket that was connected ahead of time. Emacs handles one
+request per connection, so the launcher keeps a small pool of pre-connected
+spares and tops it up after every launch. Requests made before the daemon's
+socket shows up are queued and sent once it does, instead of starting a
+second Emacs the way ``-a 'emacs'`` would.
+"""
+
+import asyncio
+import os
+import time
+from collections import deque
+
+from libqtile.log_utils import logger
+
+
+def server_socket_path(server_name="server"):
+    """Where ``emacs --daemon`` puts its server socket (Emacs 27+)."""
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        return os.path.join(runtime_dir, "emacs", server_name)
+    tmpdir = os.environ.get("TMPDIR", "/tmp")
+    return os.path.join(tmpdir, "emacs%d" % os.getuid(), server_name)
+
+
+def quote_argument(arg):
+    """Quote like emacsclient.c's quote_argument."""
+    arg = arg.replace("&", "&&").replace(" ", "&_").replace("\n", "&n")
+    if arg.startswith("-"):
+        arg = "&" + arg
+    return arg
+
+
+class EmacsLauncher:
+    def __init__(self, socket_path=None, pool_size=1, ready_timeout=60, history=50):
+        self.socket_path = socket_path or server_socket_path()
+        self.pool_size = pool_size
+        self.ready_timeout = ready_timeout
+        self._pool = deque()
+        self._queue = []
+        self._waiter = None
+        self._latency = {}
+        self._history = history
+        self._closed = False
+
+    def frame(self, qtile, expr=None, key=None):
+        """Open a new frame, evaluating ``expr`` in it if given.
+
+        Usable with ``lazy.function``. ``key`` names the entry in ``stats()``.
+        """
+        request = self._build(expr)
+        label = key or expr or "frame"
+        if not os.path.exists(self.socket_path):
+            self._enqueue(request, label)
+        else:
+            asyncio.create_task(self._send(request, label, time.monotonic()))
+
+    def _build(self, expr):
+        parts = ["-env " + quote_argument(k + "=" + v) for k, v in os.environ.items()]
+        parts.append("-dir " + quote_argument(os.path.expanduser("~") + "/"))
+        parts.append("-nowait")
+        display = os.environ.get("DISPLAY")
+        if display:
+            parts.append("-display " + quote_argument(display))
+        parts.append("-window-system")
+        if expr is not None:
+            parts.append("-eval " + quote_argument(expr))
+        return (" ".join(parts) + " \n").encode()
+
+    async def _connect(self):
+        return await asyncio.open_unix_connection(self.socket_path)
+
+    async def _take(self):
+        while self._pool:
+            reader, writer = self._pool.popleft()
+            # A spare whose Emacs went away reads as EOF.
+            if not reader.at_eof() and not writer.is_closing():
+                return reader, writer
+            writer.close()
+        return await self._connect()
+
+    async def _fill(self):
+        while len(self._pool) < self.pool_size and not self._closed:
+            try:
+                reader, writer = await self._connect()
+            except OSError:
+                return
+            if self._closed:
+                writer.close()
+                return
+            self._pool.append((reader, writer))
+
+    async def _send(self, request, label, started):
+        try:
+            reader, writer = await self._take()
+        except OSError:
+            # The socket exists but nobody is listening, e.g. Emacs restarting.
+            self._enqueue(request, label, started)
+            return
+        try:
+            writer.write(request)
+            await writer.drain()
+            # With -nowait the server closes the connection once it's done.
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if line.startswith(b"-error "):
+                    logger.error("emacs: %s", line[7:].decode(errors="replace").strip())
+        except OSError as e:
+            logger.error("emacs: request failed: %s", e)
+        finally:
+            writer.close()
+        self._record(label, time.monotonic() - started)
+        asyncio.create_task(self._fill())
+
+    def _enqueue(self, request, label, started=None):
+        self._queue.append((request, label, started or time.monotonic()))
+        if self._waiter is None or self._waiter.done():
+            self._waiter = asyncio.create_task(self._wait_for_server())
+
+    async def _wait_for_server(self):
+        deadline = time.monotonic() + self.ready_timeout
+        while time.monotonic() < deadline:
+            try:
+                reader, writer = await self._connect()
+            except OSError:
+                await asyncio.sleep(0.1)
+                continue
+            self._pool.append((reader, writer))
+            queue, self._queue = self._queue, []
+            for request, label, started in queue:
+                await self._send(request, label, started)
+            return
+        if self._queue:
+            logger.error("emacs: server did not come up, dropping %d request(s)", len(self._queue))
+            self._queue.clear()
+
+    def _record(self, label, seconds):
+        samples = self._latency.get(label)
+        if samples is None:
+            samples = self._latency[label] = deque(maxlen=self._history)
+        samples.append(seconds)
+
+    def stats(self):
+        """Launch latency per key in milliseconds: count, last, mean and max."""
+        return {
+            label: {
+                "count": len(samples),
+                "last": round(samples[-1] * 1000, 2),
+                "mean": round(sum(samples) / len(samples) * 1000, 2),
+                "max": round(max(samples) * 1000, 2),
+            }
+            for label, samples in self._latency.items()
+        }
+
+    def warm(self):
+        """Connect the spare pool as soon as the server is up."""
+        if self._closed:
+            return
+        if self._waiter is None or self._waiter.done():
+            self._waiter = asyncio.create_task(self._wait_for_server())
+
+    def close(self):
+        """Stop waiting for the server and drop the spare connections.
+
+        Frames already being sent still finish.
+        """
+        self._closed = True
+        if self._waiter is not None:
+            self._waiter.cancel()
+            self._waiter = None
+        if self._queue:
+            logger.warning("emacs: dropping %d queued request(s)", len(self._queue))
+            self._queue.clear()
+        while self._pool:
+            _, writer = self._pool.popleft()
+            writer.close()
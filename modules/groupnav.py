@@ -0,0 +1,89 @@
+from collections import deque
+
+
+class GroupNav:
+    """Group switching with a per-screen most-recently-used history.
+
+    Groups are looked up through ``qtile.groups_map`` instead of scanning
+    ``qtile.groups``, and every screen keeps a bounded MRU list of the groups it
+    has shown (most recent first), fed by the ``setgroup`` hook so switches
+    made elsewhere are recorded too. ``set_group`` is skipped when the target
+    is already on the screen.
+
+    Wire it up in the config with::
+
+        nav = GroupNav()
+        hook.subscribe.setgroup(nav.record)
+        Key([mod], "1", lazy.function(nav.toscreen, "1"))
+    """
+
+    def __init__(self, history=16):
+        self.history_size = history
+        self._history = {}
+        self._cycle = None
+        self._cycle_pos = 0
+
+    def history(self, screen):
+        """The MRU group names for ``screen``, most recent first."""
+        mru = self._history.get(screen.index)
+        if mru is None:
+            mru = self._history[screen.index] = deque(maxlen=self.history_size)
+        return mru
+
+    def record(self, *args):
+        """``setgroup`` hook: move each screen's current group to the front."""
+        from libqtile import qtile
+
+        for screen in qtile.screens:
+            group = getattr(screen, "group", None)
+            if group is None:
+                continue
+            mru = self.history(screen)
+            if mru and mru[0] == group.name:
+                continue
+            try:
+                mru.remove(group.name)
+            except ValueError:
+                pass
+            mru.appendleft(group.name)
+
+    def _show(self, qtile, name):
+        group = qtile.groups_map.get(name)
+        screen = qtile.current_screen
+        if group is None or group is screen.group:
+            return
+        screen.set_group(group)
+
+    def toscreen(self, qtile, group_name):
+        """Show ``group_name``; pressing it again goes back to the previous group."""
+        if group_name == qtile.current_screen.group.name:
+            self.back(qtile)
+        else:
+            self._show(qtile, group_name)
+
+    def back(self, qtile, n=1):
+        """Go to the group shown ``n`` switches ago on the current screen."""
+        screen = qtile.current_screen
+        mru = self.history(screen)
+        if n < len(mru):
+            self._show(qtile, mru[n])
+        elif n == 1 and getattr(screen, "previous_group", None) is not None:
+            # Nothing recorded yet, e.g. right after a restart. With no
+            # previous group either there is nowhere to go back to.
+            self._show(qtile, screen.previous_group.name)
+
+    def cycle(self, qtile):
+        """Walk back through the MRU list; each repeat goes one group further.
+
+        The order is frozen on the first press, so repeated presses don't just
+        flip between the two most recent groups. Any other switch starts over.
+        """
+        screen = qtile.current_screen
+        snapshot = self._cycle
+        if snapshot is None or snapshot[self._cycle_pos] != screen.group.name:
+            snapshot = self._cycle = list(self.history(screen))
+            self._cycle_pos = 0
+        if len(snapshot) < 2:
+            return
+        self._cycle_pos = (self._cycle_pos + 1) % len(snapshot)
+        self._show(qtile, snapshot[self._cycle_pos])
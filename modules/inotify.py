@@ -0,0 +1,106 @@
+"""Minimal ctypes binding for inotify, hooked into the asyncio loop.
+
+Only what the widgets here need: watch some paths, get a callback with the
+decoded events whenever the fd becomes readable.
+"""
+
+import asyncio
+import ctypes
+import ctypes.util
+import os
+import struct
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+
+IN_CLOEXEC = os.O_CLOEXEC
+IN_NONBLOCK = os.O_NONBLOCK
+
+_EVENT = struct.Struct("iIII")
+
+_libc = None
+
+
+def _get_libc():
+    global _libc
+    if _libc is None:
+        _libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    return _libc
+
+
+class Inotify:
+    """An inotify instance.
+
+    ``callback`` receives a list of ``(path, mask, name)`` tuples, where
+    ``path`` is the watched path and ``name`` the entry inside it (empty for
+    events on the path itself). Raises ``OSError`` if inotify is unavailable.
+    """
+
+    def __init__(self, callback):
+        libc = _get_libc()
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        self.callback = callback
+        self._paths = {}
+        self._loop = None
+
+    def add_watch(self, path, mask):
+        wd = _get_libc().inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), path)
+        self._paths[wd] = path
+        return wd
+
+    def rm_watch(self, wd):
+        if self._paths.pop(wd, None) is not None:
+            _get_libc().inotify_rm_watch(self.fd, wd)
+
+    def start(self):
+        """Start dispatching events from the running event loop."""
+        self._loop = asyncio.get_running_loop()
+        self._loop.add_reader(self.fd, self._on_readable)
+
+    def read(self):
+        events = []
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, _cookie, length = _EVENT.unpack_from(data, offset)
+                offset += _EVENT.size
+                name = data[offset : offset + length].rstrip(b"\0")
+                offset += length
+                path = self._paths.get(wd)
+                if mask & IN_IGNORED:
+                    self._paths.pop(wd, None)
+                if path is not None:
+                    events.append((path, mask, os.fsdecode(name)))
+        return events
+
+    def _on_readable(self):
+        events = self.read()
+        if events:
+            self.callback(events)
+
+    def close(self):
+        if self.fd < 0:
+            return
+        if self._loop is not None:
+            self._loop.remove_reader(self.fd)
+        os.close(self.fd)
+        self.fd = -1
@@ -0,0 +1,346 @@
+"""Timers on everything the config runs inside qtile's event loop.
+
+``instruments.install(screens, keys)`` wraps:
+
+* every (non-coroutine) hook function subscribed so far,
+* every ``lazy.function`` bound in ``keys``, key chords included,
+* every bar widget's ``poll``/``poll_async`` and ``draw``.
+
+Each wrapped callable gets a ``Histogram``: the last ``size`` durations in a
+ring buffer for percentiles, plus all-time counts per duration bucket. A
+call that holds the loop for longer than ``threshold`` seconds is logged
+(at most once a minute per callable) and kept in a list of recent slow
+calls. Threaded polls and coroutines are timed too, but they don't hold
+the loop, so they are never flagged.
+
+A probe also measures loop lag: how late a ``call_at`` actually fires. That
+catches blocking calls from code that isn't wrapped. While an ``Instruments``
+widget is polled by ``modules.scheduler``, the probe samples at that widget's
+current interval (so it follows the power profile and backoff), aligned to
+the same wall-clock multiples so it shares the scheduler's wakeups;
+otherwise every ``lag_interval`` seconds.
+
+Histograms are kept by name on the module-level ``instruments``, so they
+survive config reloads. Read them with the ``Instruments`` widget, e.g.
+``qtile cmd-obj -o widget instruments -f stats``.
+"""
+
+import asyncio
+import bisect
+import functools
+import math
+import time
+import weakref
+from array import array
+from collections import deque
+
+from libqtile import hook
+from libqtile.log_utils import logger
+from libqtile.widget import base
+
+from modules.scheduler import scheduler
+
+# Upper edges of the histogram buckets, in milliseconds.
+BUCKETS = (0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000)
+_LABELS = ["<{}ms".format(edge) for edge in BUCKETS] + [">{}ms".format(BUCKETS[-1])]
+
+
+class Histogram:
+    __slots__ = (
+        "name",
+        "blocking",
+        "samples",
+        "index",
+        "count",
+        "total",
+        "max",
+        "slow",
+        "buckets",
+        "warned",
+    )
+
+    def __init__(self, name, blocking=True, size=256):
+        self.name = name
+        self.blocking = blocking
+        self.samples = array("d", bytes(8 * size))
+        self.reset()
+
+    def reset(self):
+        self.index = 0
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.slow = 0
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.warned = 0.0
+
+    def add(self, seconds):
+        self.samples[self.index] = seconds
+        self.index = (self.index + 1) % len(self.samples)
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        self.buckets[bisect.bisect_left(BUCKETS, seconds * 1000)] += 1
+
+    def recent(self):
+        """The buffered durations, oldest first."""
+        if self.count < len(self.samples):
+            return list(self.samples[: self.count])
+        return list(self.samples[self.index :]) + list(self.samples[: self.index])
+
+    def percentile(self, p):
+        samples = sorted(self.recent())
+        if not samples:
+            return 0.0
+        return samples[min(len(samples) - 1, int(p / 100 * len(samples)))]
+
+    def stats(self):
+        """Milliseconds: mean and max over all calls, percentiles over recent ones."""
+        return {
+            "count": self.count,
+            "blocking": self.blocking,
+            "slow": self.slow,
+            "mean_ms": round(self.total * 1000 / self.count, 3) if self.count else 0,
+            "p50_ms": round(self.percentile(50) * 1000, 3),
+            "p95_ms": round(self.percentile(95) * 1000, 3),
+            "p99_ms": round(self.percentile(99) * 1000, 3),
+            "max_ms": round(self.max * 1000, 3),
+            "buckets": {label: n for label, n in zip(_LABELS, self.buckets) if n},
+        }
+
+
+class Instrumentation:
+    def __init__(
+        self, threshold=0.05, size=256, lag_interval=5, warn_interval=60
+    ):
+        self.threshold = threshold
+        self.size = size
+        self.lag_interval = lag_interval
+        self.warn_interval = warn_interval
+        self.histograms = {}
+        self.slow_calls = deque(maxlen=50)
+        self._lag_handle = None
+        self._watchers = weakref.WeakSet()
+
+    def histogram(self, name, blocking=True):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram(name, blocking, self.size)
+        return histogram
+
+    def add(self, histogram, seconds):
+        histogram.add(seconds)
+        if not histogram.blocking or seconds < self.threshold:
+            return
+        histogram.slow += 1
+        now = time.time()
+        self.slow_calls.append((now, histogram.name, seconds))
+        if now - histogram.warned >= self.warn_interval:
+            histogram.warned = now
+            logger.warning(
+                "instrument: %s: %.1f ms, over the %.0f ms threshold (%d times so far)",
+                histogram.name,
+                seconds * 1000,
+                self.threshold * 1000,
+                histogram.slow,
+            )
+
+    # -- wrappers ------------------------------------------------------------
+
+    def wrap(self, name, func, blocking=True):
+        """``func`` timed into the histogram ``name``; wrapping twice is a no-op."""
+        if getattr(func, "_instrumented", False):
+            return func
+        histogram = self.histogram(name, blocking)
+
+        if asyncio.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def timed(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    self.add(histogram, time.perf_counter() - start)
+
+        else:
+
+            @functools.wraps(func)
+            def timed(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.add(histogram, time.perf_counter() - start)
+
+        # hook unsubscription and the hot reloader look at __self__.
+        if hasattr(func, "__self__"):
+            timed.__self__ = func.__self__
+        timed._instrumented = True
+        return timed
+
+    def wrap_hooks(self):
+        for event, funcs in hook.subscriptions.items():
+            for i, func in enumerate(funcs):
+                # hook.fire schedules coroutines as tasks; nothing to time there.
+                if not asyncio.iscoroutinefunction(func):
+                    name = "hook:{}:{}".format(event, getattr(func, "__qualname__", func))
+                    funcs[i] = self.wrap(name, func)
+
+    def wrap_keys(self, keys):
+        for key in keys:
+            if hasattr(key, "submappings"):
+                self.wrap_keys(key.submappings)
+                continue
+            for command in key.commands:
+                if command.name == "function" and command.args:
+                    func, *args = command.args
+                    name = "lazy:{}".format(getattr(func, "__qualname__", func))
+                    command._args = (self.wrap(name, func), *args)
+
+    def wrap_widget(self, widget):
+        if hasattr(widget, "defer"):
+            # A LazyWidget from modules.startup: wrap the real one.
+            widget.defer(self.wrap_widget)
+            return
+        prefix = "widget:{}.".format(widget.name)
+        if hasattr(widget, "poll_async"):
+            widget.poll_async = self.wrap(prefix + "poll", widget.poll_async, blocking=False)
+        elif hasattr(widget, "poll"):
+            threaded = isinstance(widget, base.ThreadPoolText)
+            widget.poll = self.wrap(prefix + "poll", widget.poll, blocking=not threaded)
+        widget.draw = self.wrap(prefix + "draw", widget.draw)
+
+    def install(self, screens, keys=()):
+        """Wrap hooks, ``keys`` and bar widgets, and start the lag probe."""
+        self.wrap_hooks()
+        self.wrap_keys(keys)
+        for screen in screens:
+            for position in ("top", "bottom", "left", "right"):
+                bar = getattr(screen, position)
+                for widget in getattr(bar, "widgets", ()):
+                    self.wrap_widget(widget)
+        self.start_lag_probe()
+
+    # -- loop lag ------------------------------------------------------------
+
+    def start_lag_probe(self):
+        if self._lag_handle is not None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Not running under qtile, e.g. ``qtile check``.
+            return
+        histogram = self.histogram("loop:lag")
+
+        def probe(expected):
+            now = loop.time()
+            self.add(histogram, max(0.0, now - expected))
+            due = self._lag_due(now)
+            self._lag_handle = loop.call_at(due, probe, due)
+
+        due = self._lag_due(loop.time())
+        self._lag_handle = loop.call_at(due, probe, due)
+
+    def stop_lag_probe(self):
+        if self._lag_handle is not None:
+            self._lag_handle.cancel()
+            self._lag_handle = None
+
+    def _lag_due(self, loop_now):
+        """Loop time of the next sample, on the next wall-clock multiple of the interval."""
+        steps = [step for step in map(scheduler.interval, self._watchers) if step]
+        step = min(steps) if steps else self.lag_interval
+        now = time.time()
+        return loop_now + (math.floor(now / step) + 1) * step - now
+
+    def watch(self, widget):
+        """Sample loop lag as often as ``widget`` is polled by the scheduler."""
+        self._watchers.add(widget)
+        if self._lag_handle is not None:
+            # Pick up the widget's interval for the next sample.
+            self.stop_lag_probe()
+            self.start_lag_probe()
+
+    def unwatch(self, widget):
+        self._watchers.discard(widget)
+
+    # -- reporting -----------------------------------------------------------
+
+    def stats(self, name=None):
+        if name is not None:
+            return self.histograms[name].stats()
+        return {name: h.stats() for name, h in sorted(self.histograms.items())}
+
+    def worst(self):
+        """The blocking callable with the highest recent p95, other than loop lag."""
+        candidates = [
+            h for name, h in self.histograms.items() if h.blocking and name != "loop:lag"
+        ]
+        if not candidates:
+            return None
+        return max(candidates, key=lambda h: h.percentile(95))
+
+    def reset(self):
+        for histogram in self.histograms.values():
+            histogram.reset()
+        self.slow_calls.clear()
+
+
+class Instruments(base.InLoopPollText):
+    """Shows loop lag and slow calls from ``modules.instrument.instruments``.
+
+    Format fields: ``lag_p95`` and ``lag_max`` (ms), ``slow`` (slow calls
+    so far), ``worst`` (callable with the highest recent p95) and
+    ``worst_p95`` (ms). Its commands give the full numbers.
+    """
+
+    defaults = [
+        ("format", "lag {lag_p95:.0f}ms slow {slow}", "Display format."),
+        ("update_interval", 5, "Seconds between updates."),
+    ]
+
+    def __init__(self, **config):
+        base.InLoopPollText.__init__(self, **config)
+        self.add_defaults(Instruments.defaults)
+
+    def _configure(self, qtile, bar):
+        base.InLoopPollText._configure(self, qtile, bar)
+        instruments.watch(self)
+
+    def poll(self):
+        lag = instruments.histogram("loop:lag")
+        worst = instruments.worst()
+        return self.format.format(
+            lag_p95=lag.percentile(95) * 1000,
+            lag_max=lag.max * 1000,
+            slow=sum(h.slow for h in instruments.histograms.values()),
+            worst=worst.name if worst else "",
+            worst_p95=worst.percentile(95) * 1000 if worst else 0,
+        )
+
+    def cmd_stats(self, name=None):
+        """Histogram of one timed callable, or of all of them by name."""
+        return instruments.stats(name)
+
+    def cmd_slow_calls(self):
+        """The most recent calls over the threshold as ``(time, name, ms)``."""
+        return [(t, name, round(s * 1000, 3)) for t, name, s in instruments.slow_calls]
+
+    def cmd_set_threshold(self, ms):
+        """Flag (and log) calls that hold the loop for longer than ``ms`` milliseconds."""
+        instruments.threshold = ms / 1000
+
+    def cmd_reset(self):
+        """Clear every histogram and the list of slow calls."""
+        instruments.reset()
+
+    def finalize(self):
+        instruments.unwatch(self)
+        base.InLoopPollText.finalize(self)
+
+
+# Module level so histograms survive config reloads.
+instruments = Instrumentation()
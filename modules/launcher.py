@@ -0,0 +1,335 @@
+"""In-process application launcher backed by a cached $PATH index.
+
+``ExecutableIndex`` scans ``$PATH`` once, then keeps the list current from
+inotify events on every directory in it, so nothing walks ``$PATH`` on a
+keypress. Names live in a sorted list: prefix matches are a bisect, fuzzy
+matches a single compiled regex over the list. Launches are recorded in a
+frecency table saved to the qtile cache dir and used to rank results.
+
+Two frontends use it: ``LauncherPrompt`` (the Prompt widget with a ``cmd``
+completer that reads the index) and ``ExecutableIndex.dmenu``, a
+``dmenu_run`` replacement that pipes the ranked list into dmenu.
+"""
+
+import asyncio
+import bisect
+import concurrent.futures
+import json
+import os
+import re
+import time
+from functools import partial
+
+from libqtile.log_utils import logger
+from libqtile.utils import get_cache_dir
+from libqtile.widget.prompt import CommandCompleter, Prompt
+
+from modules.inotify import (
+    IN_ATTRIB,
+    IN_CREATE,
+    IN_DELETE,
+    IN_DELETE_SELF,
+    IN_MOVE_SELF,
+    IN_MOVED_FROM,
+    IN_MOVED_TO,
+    Inotify,
+)
+
+_WATCH_MASK = (
+    IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_ATTRIB | IN_DELETE_SELF | IN_MOVE_SELF
+)
+
+# Frecency: each launch counts for less the older it is (half-life in days).
+HALF_LIFE = 7
+
+
+def _scan_dir(path):
+    names = set()
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_file() and os.access(entry.path, os.X_OK):
+                        names.add(entry.name)
+                except OSError:
+                    pass
+    except OSError:
+        pass
+    return names
+
+
+# One worker: there is only ever one scan in flight.
+_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="launcher")
+
+
+class ExecutableIndex:
+    def __init__(self, path=None, history_file=None, max_history=500):
+        if path is None:
+            path = os.environ.get("PATH", CommandCompleter.DEFAULTPATH)
+        self.dirs = []
+        for d in path.split(":"):
+            d = os.path.expanduser(d)
+            if d and d not in self.dirs:
+                self.dirs.append(d)
+        self.history_file = history_file or os.path.join(get_cache_dir(), "launcher_history.json")
+        self.max_history = max_history
+        self._by_dir = {}
+        self._counts = {}
+        self.names = []
+        self._inotify = None
+        self._scanned = False
+        self._scan_future = None
+        self._pending = []
+        self.history = self._load_history()
+
+    # -- index ---------------------------------------------------------------
+
+    def _build(self):
+        by_dir = {d: _scan_dir(d) for d in self.dirs}
+        counts = {}
+        for names in by_dir.values():
+            for name in names:
+                counts[name] = counts.get(name, 0) + 1
+        return by_dir, counts
+
+    def _install(self, by_dir, counts):
+        self._by_dir = by_dir
+        self._counts = counts
+        self.names = sorted(counts)
+        self._scanned = True
+        # Changes seen while the scan ran; replaying them is harmless if the
+        # scan already saw them, _add/_discard check the current state.
+        pending, self._pending = self._pending, []
+        self._on_events(pending)
+
+    def scan(self):
+        """Full scan of every $PATH directory. Blocking; done once."""
+        self._install(*self._build())
+
+    def _scan_done(self, future):
+        if self._scanned or future is not self._scan_future:
+            return
+        try:
+            result = future.result()
+        except Exception:
+            logger.exception("launcher: background scan failed, scanning again")
+            self.scan()
+            return
+        self._install(*result)
+
+    def start(self):
+        """Watch $PATH for changes and scan it off the event loop."""
+        if self._inotify is not None:
+            return
+        try:
+            self._inotify = Inotify(self._on_events)
+            for d in self.dirs:
+                try:
+                    self._inotify.add_watch(d, _WATCH_MASK)
+                except OSError:
+                    pass
+            self._inotify.start()
+        except OSError:
+            logger.warning("launcher: inotify unavailable, index will go stale until restart")
+        if self._scanned or self._scan_future is not None:
+            return
+        loop = asyncio.get_running_loop()
+        # A concurrent future rather than an asyncio one, so that
+        # ensure_scanned can wait on it from synchronous code.
+        self._scan_future = _executor.submit(self._build)
+        self._scan_future.add_done_callback(
+            lambda future: loop.call_soon_threadsafe(self._scan_done, future)
+        )
+
+    def _add(self, d, name):
+        if name in self._by_dir.setdefault(d, set()):
+            return
+        self._by_dir[d].add(name)
+        count = self._counts.get(name, 0)
+        if not count:
+            bisect.insort(self.names, name)
+        self._counts[name] = count + 1
+
+    def _discard(self, d, name):
+        if name not in self._by_dir.get(d, ()):
+            return
+        self._by_dir[d].discard(name)
+        count = self._counts[name] - 1
+        if count:
+            self._counts[name] = count
+        else:
+            del self._counts[name]
+            i = bisect.bisect_left(self.names, name)
+            if i < len(self.names) and self.names[i] == name:
+                del self.names[i]
+
+    def _on_events(self, events):
+        if not self._scanned:
+            self._pending.extend(events)
+            return
+        for d, mask, name in events:
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                for gone in list(self._by_dir.get(d, ())):
+                    self._discard(d, gone)
+                continue
+            if not name:
+                continue
+            path = os.path.join(d, name)
+            if mask & (IN_DELETE | IN_MOVED_FROM):
+                self._discard(d, name)
+            elif os.path.isfile(path) and os.access(path, os.X_OK):
+                self._add(d, name)
+            else:
+                # e.g. chmod -x
+                self._discard(d, name)
+
+    def close(self):
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
+
+    # -- matching ------------------------------------------------------------
+
+    def ensure_scanned(self):
+        """Make sure the index is filled, waiting for the background scan if it is running."""
+        if self._scanned:
+            return
+        if self._scan_future is None:
+            self.scan()
+        else:
+            concurrent.futures.wait([self._scan_future])
+            self._scan_done(self._scan_future)
+
+    def prefix(self, txt):
+        """All names starting with ``txt``, alphabetically."""
+        self.ensure_scanned()
+        lo = bisect.bisect_left(self.names, txt)
+        hi = bisect.bisect_left(self.names, txt + "\U0010ffff", lo)
+        return self.names[lo:hi]
+
+    def fuzzy(self, txt):
+        """Names containing the characters of ``txt`` in order, alphabetically."""
+        self.ensure_scanned()
+        pattern = re.compile(".*?".join(map(re.escape, txt)))
+        return list(filter(pattern.search, self.names))
+
+    def score(self, name, now=None):
+        entry = self.history.get(name)
+        if entry is None:
+            return 0.0
+        count, last = entry
+        age_days = ((now or time.time()) - last) / 86400
+        return count * 0.5 ** (age_days / HALF_LIFE)
+
+    def rank(self, names):
+        """``names`` ordered by frecency, most used first, ties alphabetical."""
+        now = time.time()
+        scored = [(-self.score(n, now), n) for n in names if n in self.history]
+        if not scored:
+            return list(names)
+        scored.sort()
+        used = {n for _, n in scored}
+        return [n for _, n in scored] + [n for n in names if n not in used]
+
+    def complete(self, txt):
+        """Ranked completions: prefix matches, or fuzzy matches if there are none."""
+        return self.rank(self.prefix(txt) or self.fuzzy(txt))
+
+    # -- history -------------------------------------------------------------
+
+    def _load_history(self):
+        try:
+            with open(self.history_file) as f:
+                return {name: tuple(entry) for name, entry in json.load(f).items()}
+        except (OSError, ValueError, TypeError):
+            return {}
+
+    def record(self, command):
+        """Count a launch of ``command`` (only its executable name is kept)."""
+        words = command.split()
+        if not words:
+            return
+        name = os.path.basename(words[0])
+        count, _ = self.history.get(name, (0, 0))
+        self.history[name] = (count + 1, time.time())
+        if len(self.history) > self.max_history:
+            now = time.time()
+            keep = sorted(self.history, key=lambda n: self.score(n, now), reverse=True)
+            self.history = {n: self.history[n] for n in keep[: self.max_history]}
+        tmp = self.history_file + ".tmp"
+        try:
+            with open(tmp, "w") as f:
+                json.dump(self.history, f)
+            os.replace(tmp, self.history_file)
+        except OSError:
+            logger.exception("launcher: cannot save history")
+
+    # -- frontends -----------------------------------------------------------
+
+    def run(self, qtile, command):
+        self.record(command)
+        qtile.cmd_spawn(command, shell=True)
+
+    def prompt(self, qtile, widget="prompt", prompt="Run"):
+        """``lazy.function`` target: read a command in the Prompt widget and run it."""
+        qtile.widgets_map[widget].start_input(prompt, partial(self.run, qtile), "cmd")
+
+    def dmenu(self, qtile, *args):
+        """``lazy.function`` target replacing ``dmenu_run``; extra args go to dmenu."""
+        asyncio.create_task(self._dmenu(qtile, args))
+
+    async def _dmenu(self, qtile, args):
+        self.ensure_scanned()
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                "dmenu",
+                *args,
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+            )
+        except OSError:
+            logger.exception("launcher: cannot run dmenu")
+            return
+        stdout, _ = await proc.communicate("\n".join(self.rank(self.names)).encode())
+        command = stdout.decode().strip()
+        if proc.returncode == 0 and command:
+            self.run(qtile, command)
+
+
+class IndexCompleter(CommandCompleter):
+    """Prompt ``cmd`` completer that reads an ``ExecutableIndex``.
+
+    Paths (``~/...``, ``/...``) still complete against the filesystem.
+    """
+
+    def __init__(self, index, qtile, _testing=False):
+        CommandCompleter.__init__(self, qtile, _testing)
+        self.index = index
+
+    def complete(self, txt):
+        if txt and txt[0] in "~/":
+            return CommandCompleter.complete(self, txt)
+        if self.lookup is None:
+            # (display, actual) pairs like CommandCompleter, the typed text last.
+            self.lookup = [(name, name) for name in self.index.complete(txt)]
+            self.lookup.append((txt, txt))
+            self.offset = -1
+        self.offset += 1
+        if self.offset >= len(self.lookup):
+            self.offset = 0
+        display, self.thisfinal = self.lookup[self.offset]
+        return display
+
+
+class LauncherPrompt(Prompt):
+    """``Prompt`` whose ``cmd`` completion comes from an ``ExecutableIndex``."""
+
+    defaults = [
+        ("index", None, "The ExecutableIndex to complete commands from."),
+    ]
+
+    def __init__(self, **config):
+        Prompt.__init__(self, **config)
+        self.add_defaults(LauncherPrompt.defaults)
+        if self.index is not None:
+            self.completers = dict(Prompt.completers, cmd=partial(IndexCompleter, self.index))
@@ -0,0 +1,287 @@
+"""Bar refresh profiles that follow the power supply, idle time and screen lock.
+
+A profile maps widget names to multipliers of their update interval, with
+``"default"`` for the rest; ``None`` stops polling altogether. ``PowerProfiles``
+hands the active one to ``modules.scheduler`` (which already pauses the
+widgets of hidden bars) and picks it from:
+
+* AC or battery: the ``online`` attribute of the Mains and USB supplies,
+  re-read on kernel power_supply uevents like ``EventBattery`` does;
+* idle: time since the last input from the MIT-SCREEN-SAVER extension.
+  ``xset s off`` only turns off X's own blanking, the idle time still counts.
+  The check is timed for the moment the session could go idle, then runs
+  every ``wake_interval`` seconds while idle to pick up the user coming back;
+* locked: logind's ``Lock``/``Unlock`` signals for this session, which is
+  what ``loginctl lock-session`` and xss-lock style lockers use.
+
+``cycle`` (for ``lazy.function``) steps through the profiles by hand and back
+to automatic.
+"""
+
+import asyncio
+import os
+import socket
+
+from libqtile.confreader import ConfigError
+from libqtile.log_utils import logger
+from libqtile.utils import add_signal_receiver, send_notification
+
+from modules.battery import NETLINK_KOBJECT_UEVENT, SYSFS_POWER_SUPPLY
+from modules.scheduler import scheduler
+
+PROFILES = {
+    "performance": {},
+    "balanced": {"default": 2},
+    "battery": {"default": 4},
+    "idle": {"default": None},
+}
+
+LOGIND_SESSION = "org.freedesktop.login1.Session"
+
+
+def _session_path(session_id):
+    """logind's object path for a session id (sd_bus_path_encode)."""
+    if not session_id:
+        return None
+    encoded = "".join(
+        c if c.isascii() and c.isalnum() and (i or not c.isdigit()) else "_{:02x}".format(ord(c))
+        for i, c in enumerate(session_id)
+    )
+    return "/org/freedesktop/login1/session/" + encoded
+
+
+def read_ac(sysfs_dir=SYSFS_POWER_SUPPLY):
+    """True if a charger (Mains or USB supply) is online, or if there is none (a desktop)."""
+    found = False
+    try:
+        names = os.listdir(sysfs_dir)
+    except OSError:
+        return True
+    for name in names:
+        try:
+            with open(os.path.join(sysfs_dir, name, "type")) as f:
+                if f.read().strip() not in ("Mains", "USB"):
+                    continue
+            found = True
+            with open(os.path.join(sysfs_dir, name, "online")) as f:
+                if f.read().strip() == "1":
+                    return True
+        except OSError:
+            pass
+    return not found
+
+
+class PowerProfiles:
+    def __init__(
+        self,
+        profiles=None,
+        on_ac="performance",
+        on_battery="battery",
+        on_idle="idle",
+        idle_after=300,
+        wake_interval=2,
+        sysfs_dir=SYSFS_POWER_SUPPLY,
+    ):
+        self.profiles = dict(PROFILES if profiles is None else profiles)
+        for name in (on_ac, on_battery, on_idle):
+            if name not in self.profiles:
+                raise ConfigError("PowerProfiles: no profile named {!r}".format(name))
+        self.on_ac = on_ac
+        self.on_battery = on_battery
+        self.on_idle = on_idle
+        self.idle_after = idle_after
+        self.wake_interval = wake_interval
+        self.sysfs_dir = sysfs_dir
+        self.qtile = None
+        self.ac = True
+        self.idle = False
+        self.locked = False
+        self.override = None
+        self.profile = None
+        self._listeners = []
+        self._socket = None
+        self._screensaver = None
+        self._idle_handle = None
+        self._reading = False
+        self._task = None
+
+    def on_change(self, callback):
+        """Call ``callback(profile_name)`` whenever the profile changes. Usable as a decorator."""
+        self._listeners.append(callback)
+        return callback
+
+    # -- choosing ------------------------------------------------------------
+
+    def wanted(self):
+        if self.override is not None:
+            return self.override
+        if self.idle or self.locked:
+            return self.on_idle
+        return self.on_ac if self.ac else self.on_battery
+
+    def _update(self):
+        name = self.wanted()
+        if name == self.profile:
+            return
+        self.profile = name
+        multipliers = dict(self.profiles[name])
+        default = multipliers.pop("default", 1)
+        scheduler.set_multipliers(multipliers, default)
+        logger.info(
+            "power: %s profile (ac=%s idle=%s locked=%s)", name, self.ac, self.idle, self.locked
+        )
+        for callback in self._listeners:
+            try:
+                callback(name)
+            except Exception:
+                logger.exception("power: profile listener failed")
+
+    def cycle(self, qtile=None):
+        """Next profile by hand; after the last one, back to automatic."""
+        names = list(self.profiles)
+        if self.override is None:
+            self.override = names[0]
+        elif self.override == names[-1]:
+            self.override = None
+        else:
+            self.override = names[names.index(self.override) + 1]
+        self._update()
+        send_notification("Bar refresh", self.override or "auto: " + self.profile)
+
+    # -- AC ------------------------------------------------------------------
+
+    def _start_netlink(self):
+        sock = socket.socket(
+            socket.AF_NETLINK,
+            socket.SOCK_DGRAM | socket.SOCK_NONBLOCK | socket.SOCK_CLOEXEC,
+            NETLINK_KOBJECT_UEVENT,
+        )
+        try:
+            sock.bind((0, 1))
+        except OSError:
+            sock.close()
+            raise
+        self._socket = sock
+        asyncio.get_running_loop().add_reader(sock.fileno(), self._on_uevent)
+
+    def _on_uevent(self):
+        relevant = False
+        while True:
+            try:
+                data = self._socket.recv(8192)
+            except BlockingIOError:
+                break
+            relevant = relevant or b"\0SUBSYSTEM=power_supply\0" in data
+        if relevant:
+            self._read_ac()
+
+    def _read_ac(self):
+        if self._reading:
+            return
+        self._reading = True
+        # ACPI can be slow to answer, like the battery.
+        future = self.qtile.run_in_executor(read_ac, self.sysfs_dir)
+        future.add_done_callback(self._ac_read)
+
+    def _ac_read(self, future):
+        self._reading = False
+        if self.qtile is None:
+            return
+        try:
+            self.ac = future.result()
+        except Exception:
+            logger.exception("power: failed to read the power supply")
+            return
+        self._update()
+
+    # -- idle ----------------------------------------------------------------
+
+    def _start_idle(self):
+        core = self.qtile.core
+        if core.name != "x11":
+            logger.warning("power: no idle detection on the %s backend", core.name)
+            return
+        try:
+            import xcffib.screensaver
+
+            self._screensaver = core.conn.conn(xcffib.screensaver.key)
+        except Exception as e:
+            logger.warning("power: MIT-SCREEN-SAVER unavailable, no idle detection: %s", e)
+            return
+        self._check_idle()
+
+    def _check_idle(self):
+        self._idle_handle = None
+        root = self.qtile.core.conn.default_screen.root.wid
+        try:
+            idle_ms = self._screensaver.QueryInfo(root).reply().ms_since_user_input
+        except Exception as e:
+            logger.warning("power: idle query failed, giving up on idle detection: %s", e)
+            return
+        self.idle = idle_ms >= self.idle_after * 1000
+        if self.idle:
+            delay = self.wake_interval
+        else:
+            delay = self.idle_after - idle_ms / 1000 + 0.1
+        self._idle_handle = asyncio.get_running_loop().call_later(delay, self._check_idle)
+        self._update()
+
+    # -- lock ----------------------------------------------------------------
+
+    def _on_lock_signal(self, message):
+        if self.qtile is None or message.member not in ("Lock", "Unlock"):
+            return
+        self.locked = message.member == "Lock"
+        self._update()
+
+    async def _watch_lock(self):
+        path = _session_path(os.environ.get("XDG_SESSION_ID"))
+        try:
+            subscribed = await add_signal_receiver(
+                self._on_lock_signal,
+                session_bus=False,
+                dbus_interface=LOGIND_SESSION,
+                bus_name="org.freedesktop.login1",
+                path=path,
+            )
+        except Exception as e:
+            logger.warning("power: can't watch logind for screen locks: %s", e)
+            return
+        # Missing dbus-next or a refused AddMatch come back as False, not an error.
+        if not subscribed:
+            logger.warning("power: can't watch logind for screen locks, no lock detection")
+
+    # -- lifecycle -----------------------------------------------------------
+
+    async def _start(self):
+        self.ac = await self.qtile.run_in_executor(read_ac, self.sysfs_dir)
+        self._update()
+        try:
+            self._start_netlink()
+        except OSError as e:
+            logger.warning("power: power_supply events unavailable: %s", e)
+        self._start_idle()
+        await self._watch_lock()
+
+    def start(self, qtile):
+        if self._task is not None:
+            return
+        self.qtile = qtile
+        self._task = asyncio.create_task(self._start())
+
+    def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._idle_handle is not None:
+            self._idle_handle.cancel()
+            self._idle_handle = None
+        if self._socket is not None:
+            asyncio.get_event_loop().remove_reader(self._socket.fileno())
+            self._socket.close()
+            self._socket = None
+        # add_signal_receiver has no way to unsubscribe; _on_lock_signal
+        # ignores signals once qtile is None.
+        self.qtile = None
+        self.profile = None
+        scheduler.set_multipliers({})
@@ -0,0 +1,461 @@
+"""Apply an edited config.py to the running qtile without a full reload.
+
+``lazy.reload_config()`` and ``lazy.restart()`` throw away every group,
+screen, bar and widget and build them again from scratch. ``HotReloader``
+runs the new config in a fresh module and compares it with the running one.
+Then it changes only what differs:
+
+* keys are grabbed/ungrabbed only for added and removed combinations,
+  every other binding just points at its new ``Key``;
+* groups are added, deleted or relabelled, and their dgroups rules updated;
+* changed ``layouts`` are rebuilt in every group with its windows re-added;
+* ``floating_layout.float_rules`` are swapped on the live floating layout;
+* bar widgets are diffed by class and constructor arguments (lambdas are
+  compared by their code), so unchanged widgets keep their state, timers
+  and caches, and only new or changed ones are configured.
+
+Changes it can't apply in place (screens, bar settings, widget defaults,
+scratchpads) fall back to ``qtile.cmd_reload_config()``. Edits to the
+``modules`` package itself restart qtile instead: its singletons (scheduler,
+instruments, this reloader) are meant to outlive reloads, so only a fresh
+interpreter is sure to pick the new code up everywhere. Hooks subscribed by
+the old config are replaced by the new config's, and ``startup`` is fired
+again as a normal reload does.
+"""
+
+import difflib
+import functools
+import importlib.util
+import os
+import re
+import sys
+import time
+import types
+
+from libqtile import hook
+from libqtile.config import Rule, ScratchPad
+from libqtile.confreader import Config
+from libqtile.log_utils import logger
+from libqtile.utils import send_notification
+
+# Config attributes whose change means widgets or screens must be rebuilt.
+_REBUILD = ("widget_defaults", "extension_defaults", "dgroups_key_binder", "dgroups_app_rules")
+
+
+def fingerprint(obj, _seen=None):
+    """A hashable summary of a config value, equal for values that act the same.
+
+    Objects from libqtile are compared by their class and settings, functions
+    by their code and the globals it reads, anything else by identity.
+    """
+    if obj is None or isinstance(obj, (bool, int, float, str, bytes)):
+        return obj
+    if _seen is None:
+        _seen = set()
+    if id(obj) in _seen:
+        return ("cycle", type(obj).__qualname__)
+    _seen.add(id(obj))
+    try:
+        return _fingerprint(obj, _seen)
+    finally:
+        _seen.discard(id(obj))
+
+
+def _fingerprint(obj, seen):
+    fp = functools.partial(fingerprint, _seen=seen)
+    if isinstance(obj, (list, tuple)):
+        return (type(obj).__name__, tuple(map(fp, obj)))
+    if isinstance(obj, (set, frozenset)):
+        return ("set", frozenset(map(fp, obj)))
+    if isinstance(obj, dict):
+        return ("dict", tuple(sorted(((fp(k), fp(v)) for k, v in obj.items()), key=repr)))
+    if isinstance(obj, re.Pattern):
+        return ("re", obj.pattern, obj.flags)
+    if isinstance(obj, types.CodeType):
+        return ("code", obj.co_code, fp(obj.co_consts), obj.co_names)
+    if isinstance(obj, types.FunctionType) and hasattr(obj, "__wrapped__"):
+        # Timing wrappers (modules.instrument) act like what they wrap.
+        return ("wrapped", fp(obj.__wrapped__))
+    if isinstance(obj, types.FunctionType):
+        cells = []
+        for cell in obj.__closure__ or ():
+            try:
+                cells.append(fp(cell.cell_contents))
+            except ValueError:
+                cells.append(("empty",))
+        # A kept function keeps reading the old config's globals, so those
+        # have to match too.
+        names = obj.__code__.co_names
+        return (
+            "function",
+            obj.__qualname__,
+            fp(obj.__code__),
+            fp(obj.__defaults__),
+            fp(obj.__kwdefaults__),
+            tuple(cells),
+            tuple(_plain(obj.__globals__[n], seen) for n in names if n in obj.__globals__),
+        )
+    if isinstance(obj, types.MethodType):
+        return ("method", _plain(obj.__self__, seen), fp(obj.__func__))
+    if isinstance(obj, functools.partial):
+        return ("partial", fp(obj.func), fp(obj.args), fp(obj.keywords))
+    if hasattr(obj, "_user_config"):
+        # Widgets, layouts, bars: everything they act on comes from their config.
+        # A LazyWidget compares equal to the widget it stands in for.
+        name = getattr(obj, "widget_name", None) or type(obj).__qualname__
+        return (name, fp(obj._user_config))
+    if type(obj).__module__.startswith("libqtile.") and hasattr(obj, "__dict__"):
+        # Key, Group, Match, lazy calls...
+        return (type(obj).__qualname__, fp(vars(obj)))
+    return ("id", id(obj))
+
+
+def _plain(value, seen):
+    """Fingerprint plain data; anything else (modules, the qtile object...) by identity."""
+    if isinstance(value, (list, tuple, dict, set, frozenset)) or value is None:
+        return fingerprint(value, seen)
+    if isinstance(value, (bool, int, float, str, bytes)):
+        return value
+    return ("id", id(value))
+
+
+class _Fallback(Exception):
+    """The change can't be applied in place."""
+
+
+class HotReloader:
+    def __init__(self):
+        self.loaded_at = time.time()
+        self.last_report = None
+
+    def reload(self, qtile):
+        """``lazy.function`` target: apply config.py, in place where possible."""
+        start = time.perf_counter()
+        path = qtile.config.file_path
+        name = os.path.splitext(os.path.basename(path))[0]
+        old_module = sys.modules.get(name)
+        if old_module is None:
+            self._fall_back(qtile, "config not loaded yet")
+            return
+        if self._package_changed(path):
+            self._restart(qtile, "config modules changed")
+            return
+
+        saved_hooks = {event: list(funcs) for event, funcs in hook.subscriptions.items()}
+        self._unsubscribe(old_module)
+        try:
+            module = self._exec(name, path)
+            Config(keys=module.keys, mouse=module.mouse).validate()
+        except Exception as e:
+            hook.subscriptions.clear()
+            hook.subscriptions.update(saved_hooks)
+            logger.exception("hot reload: configuration error")
+            send_notification("Configuration error", str(e))
+            return
+        loaded = time.perf_counter()
+
+        try:
+            self._check(qtile, module)
+        except _Fallback as reason:
+            hook.subscriptions.clear()
+            hook.subscriptions.update(saved_hooks)
+            self._fall_back(qtile, str(reason))
+            return
+
+        report = {"exec_ms": round((loaded - start) * 1000, 2)}
+        old = {key: getattr(qtile.config, key) for key in ("keys", "mouse", "groups", "layouts")}
+        qtile.config.update(
+            **{k: v for k, v in vars(module).items() if k not in ("screens", "floating_layout")}
+        )
+        if hasattr(qtile.core, "wmname"):
+            qtile.core.wmname = getattr(qtile.config, "wmname", "qtile")
+
+        report["keys"] = self._apply_keys(qtile, old["keys"], module.keys)
+        report["mouse"] = self._apply_mouse(qtile, old["mouse"], module.mouse)
+        report["layouts"] = self._apply_layouts(qtile, old["layouts"], module.layouts)
+        report["float_rules"] = self._apply_float_rules(qtile, module.floating_layout)
+        report["groups"] = self._apply_groups(qtile, old["groups"], module.groups)
+        report["widgets"] = self._apply_widgets(qtile, module.screens)
+
+        sys.modules[name] = module
+        hook.fire("startup")
+        self._close_replaced(old_module, module)
+        self.loaded_at = time.time()
+
+        report["ms"] = round((time.perf_counter() - start) * 1000, 2)
+        self.last_report = report
+        logger.info("hot reload: %s", report)
+
+    # -- loading -------------------------------------------------------------
+
+    def _package_changed(self, path):
+        """Whether a module next to the config changed since it was imported.
+
+        The hot path doesn't re-import those (that's what keeps their caches),
+        so edits to them need a restart. ``loaded_at`` moves on with every
+        reload, so an edit only triggers one.
+        """
+        folder = os.path.dirname(os.path.abspath(path))
+        for module in list(sys.modules.values()):
+            filename = getattr(module, "__file__", None)
+            if not filename or not filename.startswith(folder + os.sep):
+                continue
+            if os.path.abspath(filename) == os.path.abspath(path):
+                continue
+            try:
+                if os.stat(filename).st_mtime > self.loaded_at:
+                    return True
+            except OSError:
+                return True
+        return False
+
+    @staticmethod
+    def _unsubscribe(module):
+        """Drop the hooks the old config subscribed; widgets and qtile keep theirs."""
+        owned = {id(value) for value in vars(module).values()}
+        for funcs in hook.subscriptions.values():
+            funcs[:] = [
+                func
+                for func in funcs
+                if getattr(func, "__module__", None) != module.__name__
+                and id(getattr(func, "__self__", None)) not in owned
+            ]
+
+    @staticmethod
+    def _exec(name, path):
+        spec = importlib.util.spec_from_file_location(name, path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return module
+
+    def _fall_back(self, qtile, reason):
+        logger.info("hot reload: %s, doing a full reload", reason)
+        self.last_report = {"fallback": reason}
+        qtile.cmd_reload_config()
+        self.loaded_at = time.time()
+
+    def _restart(self, qtile, reason):
+        if not qtile.core.supports_restarting:
+            self._fall_back(qtile, reason + " (the backend can't restart)")
+            return
+        logger.info("hot reload: %s, restarting", reason)
+        self.last_report = {"restart": reason}
+        qtile.cmd_restart()
+
+    def _check(self, qtile, module):
+        for key in _REBUILD:
+            if fingerprint(getattr(module, key, None)) != fingerprint(getattr(qtile.config, key)):
+                raise _Fallback(key + " changed")
+
+        old_floating = qtile.config.floating_layout
+        if fingerprint(module.floating_layout) != fingerprint(old_floating):
+            raise _Fallback("floating_layout settings changed")
+
+        scratchpads = [g for g in module.groups if isinstance(g, ScratchPad)]
+        running = [g for g in qtile.config.groups if isinstance(g, ScratchPad)]
+        if fingerprint(scratchpads) != fingerprint(running):
+            raise _Fallback("scratchpads changed")
+
+        old_screens = qtile.config.screens
+        if len(module.screens) != len(old_screens):
+            raise _Fallback("number of screens changed")
+        for new, live in zip(module.screens, qtile.screens):
+            for attr in ("wallpaper", "wallpaper_mode"):
+                if getattr(new, attr, None) != getattr(live, attr, None):
+                    raise _Fallback("screen " + attr + " changed")
+            for position in ("top", "bottom", "left", "right"):
+                new_bar, live_bar = getattr(new, position), getattr(live, position)
+                if (new_bar is None) != (live_bar is None):
+                    raise _Fallback(position + " bar added or removed")
+                if new_bar is None:
+                    continue
+                if type(new_bar) is not type(live_bar) or new_bar.size != live_bar.size:
+                    raise _Fallback(position + " bar changed")
+                if not hasattr(live_bar, "widgets"):
+                    continue
+                if fingerprint(new_bar._user_config) != fingerprint(live_bar._user_config):
+                    raise _Fallback(position + " bar settings changed")
+
+    # -- applying ------------------------------------------------------------
+
+    @staticmethod
+    def _combo(key):
+        return key.key, frozenset(key.modifiers)
+
+    def _apply_keys(self, qtile, old_keys, new_keys):
+        if qtile.chord_stack:
+            qtile.cmd_ungrab_all_chords()
+        old = {self._combo(k): k for k in old_keys}
+        new = {self._combo(k): k for k in new_keys}
+        slot = {id(k): entry for entry, k in qtile.keys_map.items()}
+        counts = {"added": 0, "removed": 0, "changed": 0}
+        for combo, key in old.items():
+            if combo not in new:
+                qtile.ungrab_key(key)
+                counts["removed"] += 1
+        for combo, key in new.items():
+            old_key = old.get(combo)
+            if old_key is None or id(old_key) not in slot:
+                qtile.grab_key(key)
+                counts["added"] += 1
+                continue
+            # Same keysym and modifiers: the grab stays, only the action changes.
+            qtile.keys_map[slot[id(old_key)]] = key
+            if fingerprint(key) != fingerprint(old_key):
+                counts["changed"] += 1
+        return counts
+
+    @staticmethod
+    def _apply_mouse(qtile, old_mouse, new_mouse):
+        if fingerprint(old_mouse) == fingerprint(new_mouse):
+            return False
+        qtile.core.ungrab_buttons()
+        qtile.mouse_map.clear()
+        for button in new_mouse:
+            qtile.grab_button(button)
+        return True
+
+    @staticmethod
+    def _replace_layouts(group, layouts):
+        current = group.layout.name if group.layouts else None
+        tiled = [win for win in group.windows if win in group.tiled_windows]
+        for layout in group.layouts:
+            layout.finalize()
+        group.layouts = [layout.clone(group) for layout in layouts]
+        names = [layout.name for layout in group.layouts]
+        group.current_layout = names.index(current) if current in names else 0
+        for layout in group.layouts:
+            for win in tiled:
+                layout.add(win)
+            if group.current_window in tiled:
+                layout.focus(group.current_window)
+        if group.screen is not None:
+            group.layout_all()
+
+    def _apply_layouts(self, qtile, old_layouts, new_layouts):
+        if fingerprint(old_layouts) == fingerprint(new_layouts):
+            return False
+        configured = {g.name: g for g in qtile.config.groups}
+        for group in qtile.groups:
+            spec = configured.get(group.name)
+            if spec is not None and spec.layouts:
+                continue
+            self._replace_layouts(group, new_layouts)
+        return True
+
+    @staticmethod
+    def _apply_float_rules(qtile, new_floating):
+        floating = qtile.config.floating_layout
+        if fingerprint(floating.float_rules) == fingerprint(new_floating.float_rules):
+            return False
+        # Groups share this instance, so floating windows stay where they are.
+        floating.float_rules = new_floating.float_rules
+        return True
+
+    def _apply_groups(self, qtile, old_groups, new_groups):
+        old = {g.name: g for g in old_groups}
+        new = {g.name: g for g in new_groups}
+        dgroups = qtile.dgroups
+        counts = {"added": 0, "removed": 0, "changed": 0}
+
+        for name in old:
+            if name in new:
+                continue
+            if name in qtile.groups_map:
+                try:
+                    qtile.delete_group(name)
+                except ValueError as e:
+                    logger.warning("hot reload: keeping group %s: %s", name, e)
+                    continue
+            dgroups.groups_map.pop(name, None)
+            dgroups.rules = [r for r in dgroups.rules if r.group != name]
+            dgroups.rules_map = {i: r for i, r in dgroups.rules_map.items() if r.group != name}
+            counts["removed"] += 1
+
+        for name, group in new.items():
+            previous = old.get(name)
+            if previous is None:
+                dgroups.add_dgroup(group, group.init)
+                counts["added"] += 1
+                continue
+            if fingerprint(group) == fingerprint(previous):
+                continue
+            dgroups.groups_map[name] = group
+            old_matches = fingerprint(previous.matches)
+            for i, rule in enumerate(dgroups.rules):
+                if rule.group == name and fingerprint(rule.matchlist) == old_matches:
+                    dgroups.rules[i] = Rule(group.matches, group=name)
+            live = qtile.groups_map.get(name)
+            if live is not None:
+                live.label = name if group.label is None else group.label
+                if fingerprint(group.layouts) != fingerprint(previous.layouts):
+                    self._replace_layouts(live, group.layouts or qtile.config.layouts)
+            counts["changed"] += 1
+
+        if any(counts.values()):
+            hook.fire("changegroup")
+        return counts
+
+    def _apply_widgets(self, qtile, new_screens):
+        counts = {"added": 0, "removed": 0, "kept": 0}
+        for new, live in zip(new_screens, qtile.screens):
+            for position in ("top", "bottom", "left", "right"):
+                bar = getattr(live, position)
+                if bar is None or not hasattr(bar, "widgets"):
+                    continue
+                self._diff_bar(qtile, bar, getattr(new, position).widgets, counts)
+        return counts
+
+    def _diff_bar(self, qtile, bar, new_widgets, counts):
+        old_widgets = bar.widgets
+        matcher = difflib.SequenceMatcher(
+            None,
+            [fingerprint(w) for w in old_widgets],
+            [fingerprint(w) for w in new_widgets],
+            autojunk=False,
+        )
+        widgets, added, removed = [], [], []
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == "equal":
+                widgets.extend(old_widgets[i1:i2])
+            else:
+                removed.extend(old_widgets[i1:i2])
+                widgets.extend(new_widgets[j1:j2])
+                added.extend(new_widgets[j1:j2])
+        counts["kept"] += len(widgets) - len(added)
+        if not added and not removed:
+            return
+
+        for widget in removed:
+            widget.finalize()
+            for name, registered in list(qtile.widgets_map.items()):
+                if registered is widget:
+                    del qtile.widgets_map[name]
+        bar.widgets = widgets
+        for widget in added:
+            if bar._configure_widget(widget):
+                qtile.register_widget(widget)
+            else:
+                widgets.remove(widget)
+        counts["added"] += len(added)
+        counts["removed"] += len(removed)
+        # One full draw places and paints everything; kept widgets that didn't
+        # move are skipped by CachedBar.
+        bar.draw()
+
+    @staticmethod
+    def _close_replaced(old_module, module):
+        """``close()`` top-level objects of the old config that the new one replaced."""
+        current = {id(value) for value in vars(module).values()}
+        for name, value in vars(old_module).items():
+            if name.startswith("_") or isinstance(value, (type, types.ModuleType)):
+                continue
+            close = getattr(value, "close", None)
+            if id(value) not in current and callable(close):
+                try:
+                    close()
+                except Exception:
+                    logger.exception("hot reload: closing %s", name)
+
+
+reloader = HotReloader()
@@ -0,0 +1,236 @@
+"""Bar drawing that skips work for widgets that haven't changed.
+
+Every full bar draw (any text widget changing width triggers one) repaints
+every widget, including the powerline glyphs and fixed labels, which have
+to be laid out by pango again each time. Two pieces cut that down:
+
+``CachedTextBox`` is a ``TextBox`` that renders its text once per (text,
+font, colours, size) into an image surface shared by all identical boxes,
+and afterwards only copies that surface to the bar.
+
+``CachedBar`` wraps the ``draw`` of its text widgets and skips it when the
+widget would paint exactly what is already on screen: same text, colours,
+font and place, and no expose or reconfigure of the bar since. A widget
+whose text changed still redraws on its own, as ``_TextBox.update`` does.
+Draw counts and times are kept per widget, see ``cmd_render_stats``.
+"""
+
+import math
+import time
+from collections import OrderedDict
+
+import cairocffi
+from libqtile import bar, pangocffi
+from libqtile.widget import base
+from libqtile.widget.textbox import TextBox
+
+_surfaces = OrderedDict()
+SURFACE_CACHE_SIZE = 64
+
+
+def _hashable(colour):
+    return tuple(colour) if isinstance(colour, list) else colour
+
+
+class CachedTextBox(TextBox):
+    """A ``TextBox`` for static text, drawn from a cached image surface.
+
+    Use it for text that never (or rarely) changes: separators, glyphs and
+    labels. Vertical bars fall back to the normal drawing.
+    """
+
+    def _surface_key(self):
+        return (
+            self.layout.text,
+            self.font,
+            self.fontsize,
+            self.markup,
+            _hashable(self.layout.colour),
+            _hashable(self.fontshadow),
+            _hashable(self.background or self.bar.background),
+            self.actual_padding,
+            self.width,
+            self.bar.height,
+        )
+
+    def _render(self):
+        width = math.ceil(self.width)
+        surface = cairocffi.ImageSurface(cairocffi.FORMAT_ARGB32, width, self.bar.height)
+        # TextLayout.draw paints on drawer.ctx, so point that at the surface
+        # for the duration; set_source_rgb keeps the drawer's colour handling.
+        drawer_ctx = self.drawer.ctx
+        self.drawer.ctx = pangocffi.patch_cairo_context(cairocffi.Context(surface))
+        try:
+            self.drawer.set_source_rgb(self.background or self.bar.background)
+            self.drawer.ctx.paint()
+            self.layout.draw(
+                self.actual_padding or 0,
+                int(self.bar.height / 2.0 - self.layout.height / 2.0) + 1,
+            )
+        finally:
+            self.drawer.ctx = drawer_ctx
+        surface.flush()
+        return surface
+
+    def draw(self):
+        if not self.can_draw():
+            return
+        if not self.bar.horizontal or not self.width:
+            TextBox.draw(self)
+            return
+        key = self._surface_key()
+        surface = _surfaces.get(key)
+        if surface is None:
+            surface = _surfaces[key] = self._render()
+            if len(_surfaces) > SURFACE_CACHE_SIZE:
+                _surfaces.popitem(last=False)
+        else:
+            _surfaces.move_to_end(key)
+        self.drawer.ctx.set_operator(cairocffi.OPERATOR_SOURCE)
+        self.drawer.ctx.set_source_surface(surface)
+        self.drawer.ctx.paint()
+        self.drawer.ctx.set_operator(cairocffi.OPERATOR_OVER)
+        self.drawer.draw(offsetx=self.offsetx, offsety=self.offsety, width=self.width)
+
+
+def _has_mirrors(drawer):
+    # Drawer.mirrors (qtile 0.21) is Drawer.has_mirrors in later releases.
+    return bool(getattr(drawer, "has_mirrors", getattr(drawer, "mirrors", True)))
+
+
+class _DrawStats:
+    __slots__ = ("draws", "skipped", "seconds")
+
+    def __init__(self):
+        self.draws = 0
+        self.skipped = 0
+        self.seconds = 0.0
+
+
+class CachedBar(bar.Bar):
+    """A ``Bar`` that doesn't redraw text widgets whose output hasn't changed.
+
+    Only widgets using the stock ``_TextBox`` drawing (and ``CachedTextBox``)
+    are skipped; anything with its own ``draw``, or mirrored onto another
+    bar, is always drawn.
+    """
+
+    defaults = [
+        ("skip_unchanged", True, "Skip drawing text widgets that look the same as last time."),
+    ]
+
+    def __init__(self, widgets, size, **config):
+        bar.Bar.__init__(self, widgets, size, **config)
+        self.add_defaults(CachedBar.defaults)
+        # Bumped whenever the window contents may have been lost.
+        self.generation = 0
+        self._drawn = {}
+        self._stats = {}
+        self.frames = 0
+        self.frame_seconds = 0.0
+
+    def _configure(self, qtile, screen, reconfigure=False):
+        self.generation += 1
+        bar.Bar._configure(self, qtile, screen, reconfigure)
+
+    def process_window_expose(self):
+        self.generation += 1
+        bar.Bar.process_window_expose(self)
+
+    def _configure_widget(self, widget):
+        success = bar.Bar._configure_widget(self, widget)
+        if success and id(widget) not in self._stats:
+            self._stats[id(widget)] = _DrawStats()
+            if type(widget).draw in (base._TextBox.draw, CachedTextBox.draw):
+                widget.draw = self._cached_draw(widget, widget.draw)
+            else:
+                widget.draw = self._timed_draw(widget, widget.draw)
+        return success
+
+    def _signature(self, widget):
+        return (
+            self.generation,
+            widget.offsetx,
+            widget.offsety,
+            widget.length,
+            widget.layout.text,
+            _hashable(widget.layout.colour),
+            widget.font,
+            widget.fontsize,
+            _hashable(widget.fontshadow),
+            _hashable(widget.background or self.background),
+            widget.actual_padding,
+        )
+
+    def _timed_draw(self, widget, draw):
+        stats = self._stats[id(widget)]
+
+        def timed():
+            start = time.perf_counter()
+            draw()
+            stats.seconds += time.perf_counter() - start
+            stats.draws += 1
+
+        return timed
+
+    def _cached_draw(self, widget, draw):
+        stats = self._stats[id(widget)]
+
+        def cached():
+            if not widget.can_draw():
+                return
+            signature = self._signature(widget)
+            if (
+                self.skip_unchanged
+                and self._drawn.get(id(widget)) == signature
+                and not _has_mirrors(widget.drawer)
+            ):
+                stats.skipped += 1
+                return
+            start = time.perf_counter()
+            draw()
+            stats.seconds += time.perf_counter() - start
+            stats.draws += 1
+            self._drawn[id(widget)] = signature
+
+        return cached
+
+    def _actual_draw(self):
+        start = time.perf_counter()
+        bar.Bar._actual_draw(self)
+        self.frame_seconds += time.perf_counter() - start
+        self.frames += 1
+
+    def cmd_render_stats(self):
+        """Draw counts and time per widget, and per full bar draw, in milliseconds."""
+        widgets = {}
+        for i, widget in enumerate(self.widgets):
+            stats = self._stats.get(id(widget))
+            if stats is None:
+                continue
+            widgets["{}:{}".format(i, widget.name)] = {
+                "draws": stats.draws,
+                "skipped": stats.skipped,
+                "ms": round(stats.seconds * 1000, 3),
+                "ms_per_draw": round(stats.seconds * 1000 / stats.draws, 3) if stats.draws else 0,
+            }
+        frame_ms = self.frame_seconds * 1000
+        return {
+            "frames": self.frames,
+            "ms_per_frame": round(frame_ms / self.frames, 3) if self.frames else 0,
+            "draws": sum(s.draws for s in self._stats.values()),
+            "skipped": sum(s.skipped for s in self._stats.values()),
+            "widgets": widgets,
+        }
+
+    def cmd_reset_render_stats(self):
+        for stats in self._stats.values():
+            stats.draws = stats.skipped = 0
+            stats.seconds = 0.0
+        self.frames = 0
+        self.frame_seconds = 0.0
+
+    def cmd_set_skip_unchanged(self, skip=True):
+        """Turn skipping on or off, e.g. to compare ``render_stats`` both ways."""
+        self.skip_unchanged = skip
+        self.generation += 1
@@ -0,0 +1,159 @@
+"""Window-to-group routing.
+
+``follow_window`` used to walk every group and call ``Match.compare`` on each
+of its matches for every new client. ``GroupRouter`` compiles the group matches
+once into:
+
+* an exact tier: dicts from wm_class / role strings to the first group that
+  lists them, for matches with a single rule that only ever compares for
+  equality: a list of strings, or an anchored ``^(a|b)$`` regex of literals
+  (what newer qtile compiles such a list into). A plain string is an
+  "include" match in ``Match.compare``, not an equality, so it falls back;
+* a fallback tier: every other match (regexes, titles, compound rules,
+  ``func``), still checked with ``Match.compare`` so the semantics don't change;
+* a small LRU cache of recent (wm_class, role, title) -> group decisions.
+
+Priority is the same as the old linear scan: the first group (and the first
+match inside it) that matches the client wins.
+"""
+
+from __future__ import annotations
+
+import re
+from collections import OrderedDict
+
+# Rule keys that GroupRouter reads itself; anything else (func, pid, wid,
+# wm_type) makes a cached decision unsafe.
+_CACHEABLE_RULES = {"title", "wm_class", "wm_instance_class", "role"}
+
+_MISS = object()
+
+
+_ANCHORED = re.compile(r"\^(?:\((.*)\)|(.*))\$", re.DOTALL)
+_TOKEN = re.compile(r"\\.|.", re.DOTALL)
+_SPECIAL = set(".^$*+?{}[]|()\\")
+
+
+def _alternatives(body):
+    """The literal strings ``a|b|c`` matches, or None if it uses any other syntax."""
+    names, current = [], []
+    for token in _TOKEN.findall(body):
+        if token == "|":
+            names.append("".join(current))
+            current = []
+        elif len(token) == 2:
+            # re.escape() only escapes punctuation; \d, \w and so on are classes.
+            if token[1].isalnum():
+                return None
+            current.append(token[1])
+        elif token in _SPECIAL:
+            return None
+        else:
+            current.append(token)
+    names.append("".join(current))
+    return names
+
+
+def _exact_names(value):
+    """The names a wm_class / role rule matches exactly, or None if it isn't that simple."""
+    if isinstance(value, str):
+        # Match.compare does a substring test on strings.
+        return None
+    if isinstance(value, (list, tuple, set)):
+        return list(value) if all(isinstance(v, str) for v in value) else None
+    pattern = getattr(value, "pattern", None)
+    if not isinstance(pattern, str) or value.flags & ~re.UNICODE:
+        return None
+    anchored = _ANCHORED.fullmatch(pattern)
+    if anchored is None:
+        return None
+    if anchored.group(1) is not None:
+        return _alternatives(anchored.group(1))
+    # Without the group, ^a|b$ is "starts with a or ends with b".
+    names = _alternatives(anchored.group(2))
+    return names if names is not None and len(names) == 1 else None
+
+
+class GroupRouter:
+    def __init__(self, groups, cache_size=128):
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self.compile(groups)
+
+    def compile(self, groups):
+        """(Re)build the index from a list of ``Group`` objects."""
+        self._by_class = {}
+        self._by_role = {}
+        self._fallback = []
+        cacheable = True
+        order = 0
+
+        for group in groups:
+            for match in group.matches or ():
+                rules = match._rules
+                key = next(iter(rules)) if len(rules) == 1 else None
+                names = _exact_names(rules[key]) if key in ("wm_class", "role") else None
+                if names is not None:
+                    index = self._by_class if key == "wm_class" else self._by_role
+                    for name in names:
+                        index.setdefault(name, (order, group.name))
+                else:
+                    self._fallback.append((order, group.name, match))
+                    cacheable = cacheable and set(rules) <= _CACHEABLE_RULES
+                order += 1
+
+        rules = set()
+        for _, _, match in self._fallback:
+            rules.update(match._rules)
+        self._needs_role = bool(self._by_role) or "role" in rules
+        self._needs_title = "title" in rules
+        self._cacheable = cacheable and self.cache_size > 0
+        self._cache.clear()
+
+    def sizes(self):
+        """How many names each tier holds, and how many matches fell back."""
+        return {
+            "wm_class": len(self._by_class),
+            "role": len(self._by_role),
+            "fallback": len(self._fallback),
+        }
+
+    def route(self, client):
+        """Return the name of the group ``client`` belongs to, or None."""
+        wm_class = tuple(client.get_wm_class() or ())
+        role = client.get_wm_role() if self._needs_role else None
+        title = client.name if self._needs_title else None
+
+        if self._cacheable:
+            key = (wm_class, role, title)
+            found = self._cache.get(key, _MISS)
+            if found is not _MISS:
+                self._cache.move_to_end(key)
+                return found
+
+        found = self._lookup(client, wm_class, role)
+
+        if self._cacheable:
+            self._cache[key] = found
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return found
+
+    def _lookup(self, client, wm_class, role):
+        best = None
+        for value in wm_class:
+            hit = self._by_class.get(value)
+            if hit is not None and (best is None or hit < best):
+                best = hit
+        if role is not None:
+            hit = self._by_role.get(role)
+            if hit is not None and (best is None or hit < best):
+                best = hit
+
+        # Only fallback rules declared before the exact hit can beat it.
+        for order, name, match in self._fallback:
+            if best is not None and order > best[0]:
+                break
+            if match.compare(client):
+                return name
+        return best[1] if best is not None else None
@@ -0,0 +1,291 @@
+"""One shared timer for every polling widget in the bar.
+
+Left alone, each polling widget arms its own ``call_later`` and redraws
+itself whenever its text changes, so a bar full of 1s widgets wakes the loop
+several times a second at slightly different moments. ``Scheduler`` takes over
+their ``timer_setup``:
+
+* due times are aligned to wall-clock multiples of each widget's interval, so
+  widgets with the same (or dividing) intervals fire in the same tick;
+* everything due in a tick is polled together (threaded polls on the qtile
+  executor, ``poll_async`` coroutines awaited). As in ``_TextBox.update``, a
+  widget whose width didn't change redraws only itself; the bar is drawn
+  once per tick, and only if some widget's width changed;
+* a widget whose text didn't change has its interval doubled, up to
+  ``max_backoff`` times the configured one, and snaps back on the next change;
+* ``set_multipliers`` scales intervals per widget name (a refresh profile,
+  see ``modules.power``), and widgets whose multiplier is None or whose bar
+  is hidden aren't polled at all; they poll straight away once they resume.
+
+``stats()`` reports what the bar would have cost with independent timers next
+to what it actually did.
+"""
+
+import asyncio
+import functools
+import math
+import time
+import weakref
+
+from libqtile.log_utils import logger
+from libqtile.widget import base
+
+
+class _Entry:
+    __slots__ = ("widget", "interval", "backoff", "multiplier", "factor", "due", "running")
+
+    def __init__(self, widget, interval, backoff):
+        self.widget = widget
+        self.interval = interval
+        self.backoff = backoff
+        self.multiplier = 1
+        # From set_multipliers(); None stops polling.
+        self.factor = 1
+        self.due = 0.0
+        self.running = False
+
+
+class Scheduler:
+    def __init__(self, resolution=1.0, max_backoff=8):
+        self.resolution = resolution
+        self.max_backoff = max_backoff
+        self._entries = {}
+        self._handle = None
+        self._armed_for = None
+        self._multipliers = {}
+        self._default_multiplier = 1
+        self._hidden_bars = weakref.WeakSet()
+        self._watched_bars = weakref.WeakSet()
+        self.reset_stats()
+
+    def manage(self, widget, backoff=True):
+        """Take over the timer of ``widget`` if it is a polling widget.
+
+        Must be called before the bar is configured. Returns the widget so it
+        can be used inline in a widget list.
+        """
+        if hasattr(widget, "defer"):
+            # A LazyWidget: manage the real widget once it exists.
+            widget.defer(functools.partial(self.manage, backoff=backoff))
+            return widget
+        interval = getattr(widget, "update_interval", None)
+        polls = hasattr(widget, "poll") or hasattr(widget, "poll_async")
+        if not interval or not polls or not isinstance(widget, base._TextBox):
+            return widget
+        widget.timer_setup = functools.partial(self._register, widget, interval, backoff)
+        widget.finalize = functools.partial(self._finalize, widget, widget.finalize)
+        return widget
+
+    def manage_all(self, widgets, steady=()):
+        """``manage`` every widget in ``widgets``; names in ``steady`` never back off."""
+        for widget in widgets:
+            self.manage(widget, backoff=widget.name not in steady)
+
+    def _register(self, widget, interval, backoff):
+        interval = max(self.resolution, math.ceil(interval / self.resolution) * self.resolution)
+        entry = _Entry(widget, interval, backoff)
+        entry.factor = self._multipliers.get(widget.name, self._default_multiplier)
+        # Poll straight away, like the widget's own timer_setup would.
+        entry.due = time.time()
+        self._entries[id(widget)] = entry
+        self._watch_bar(widget.bar)
+        self._arm()
+
+    def _finalize(self, widget, finalize):
+        self._entries.pop(id(widget), None)
+        finalize()
+
+    def _paused(self, entry):
+        return entry.factor is None or entry.widget.bar in self._hidden_bars
+
+    def _arm(self):
+        dues = [e.due for e in self._entries.values() if not self._paused(e)]
+        if not dues:
+            return
+        due = min(dues)
+        if self._handle is not None:
+            if self._armed_for <= due:
+                return
+            self._handle.cancel()
+        loop = asyncio.get_running_loop()
+        self._armed_for = due
+        self._handle = loop.call_later(max(0.0, due - time.time()), self._tick)
+
+    def _step(self, entry):
+        return entry.interval * entry.multiplier * entry.factor
+
+    def interval(self, widget):
+        """Seconds between polls of ``widget`` right now; None if it isn't polled."""
+        entry = self._entries.get(id(widget))
+        if entry is None or self._paused(entry):
+            return None
+        return self._step(entry)
+
+    def _tick(self):
+        self._handle = None
+        self.wakeups += 1
+        now = time.time()
+        # Small slack so entries due a hair later still share this tick.
+        batch = [
+            e
+            for e in self._entries.values()
+            if e.due <= now + 0.01 and not e.running and not self._paused(e)
+        ]
+        for entry in batch:
+            entry.running = True
+            step = self._step(entry)
+            entry.due = (math.floor(now / step) + 1) * step
+        if batch:
+            asyncio.create_task(self._run(batch))
+        self._arm()
+
+    async def _poll(self, entry):
+        widget = entry.widget
+        if hasattr(widget, "poll_async"):
+            return await widget.poll_async()
+        if isinstance(widget, base.ThreadPoolText):
+            return await widget.qtile.run_in_executor(widget.poll)
+        return widget.poll()
+
+    async def _run(self, batch):
+        try:
+            results = await asyncio.gather(
+                *(self._poll(e) for e in batch), return_exceptions=True
+            )
+        finally:
+            for entry in batch:
+                entry.running = False
+        self.polls += len(batch)
+        bars, redraw = [], []
+        for entry, text in zip(batch, results):
+            widget = entry.widget
+            if isinstance(text, Exception):
+                logger.error("%s: poll failed: %r", widget.name, text)
+                continue
+            if text is None or text == widget.text:
+                if entry.backoff:
+                    entry.multiplier = min(entry.multiplier * 2, self.max_backoff)
+                continue
+            # A profile may have paused the widget while it was polling; it
+            # gets a due time again when it resumes.
+            if entry.multiplier != 1 and not self._paused(entry):
+                entry.multiplier = 1
+                step = self._step(entry)
+                next_due = (math.floor(time.time() / step) + 1) * step
+                entry.due = min(entry.due, next_due)
+            layout = getattr(widget, "layout", None)
+            old_width = layout.width if layout is not None else None
+            widget.text = text
+            self.changes += 1
+            if old_width is not None and widget.layout.width == old_width:
+                redraw.append(widget)
+            else:
+                self.width_changes += 1
+                if widget.bar not in bars:
+                    bars.append(widget.bar)
+        for widget in redraw:
+            # A full draw of its bar paints it anyway.
+            if widget.bar not in bars:
+                widget.draw()
+                self.widget_draws += 1
+        for bar in bars:
+            bar.draw()
+            self.draws += 1
+        self._arm()
+
+    async def poll_all(self):
+        """Poll every managed widget now and draw once, like a tick where all are due."""
+        batch = [e for e in self._entries.values() if not e.running]
+        for entry in batch:
+            entry.running = True
+        await self._run(batch)
+
+    def _change(self, entries, change):
+        """Apply ``change()`` and re-time ``entries`` for their new step."""
+        was_paused = {id(e): self._paused(e) for e in entries}
+        change()
+        now = time.time()
+        for entry in entries:
+            if self._paused(entry):
+                continue
+            if was_paused[id(entry)]:
+                entry.due = now
+            else:
+                step = self._step(entry)
+                entry.due = min(entry.due, (math.floor(now / step) + 1) * step)
+        self._arm()
+
+    def set_multipliers(self, multipliers, default=1):
+        """Poll each widget every ``multipliers.get(widget.name, default)`` times its interval.
+
+        None stops polling the widget until a later call gives it a number.
+        Applies to widgets managed later too.
+        """
+
+        def change():
+            self._multipliers = dict(multipliers)
+            self._default_multiplier = default
+            for entry in self._entries.values():
+                entry.factor = self._multipliers.get(entry.widget.name, default)
+
+        self._change(list(self._entries.values()), change)
+
+    def _watch_bar(self, bar):
+        """Pause the widgets of ``bar`` while it's hidden (``lazy.hide_show_bar``)."""
+        if bar is None or bar in self._watched_bars or not hasattr(bar, "show"):
+            return
+        self._watched_bars.add(bar)
+        show = bar.show
+
+        def watched_show(is_show=True):
+            show(is_show)
+            self._bar_toggled(bar)
+
+        bar.show = watched_show
+        self._bar_toggled(bar)
+
+    def _bar_toggled(self, bar):
+        def change():
+            if bar.is_show():
+                self._hidden_bars.discard(bar)
+            else:
+                self._hidden_bars.add(bar)
+
+        self._change([e for e in self._entries.values() if e.widget.bar is bar], change)
+
+    def reset_stats(self):
+        self.wakeups = 0
+        self.polls = 0
+        self.changes = 0
+        self.width_changes = 0
+        self.draws = 0
+        self.widget_draws = 0
+        self._started = time.monotonic()
+
+    def stats(self):
+        """Wakeups and draws per second, with and without the shared tick.
+
+        The baseline assumes each widget kept its own timer (one wakeup per
+        configured interval) and, like ``_TextBox.update``, redrew itself on
+        every text change, or the whole bar when its width changed. Draws
+        count widget and bar draws alike; ``bar_draws`` are the full ones.
+        """
+        elapsed = max(time.monotonic() - self._started, 1e-9)
+        return {
+            "widgets": len(self._entries),
+            "paused": sum(1 for e in self._entries.values() if self._paused(e)),
+            "baseline_wakeups_per_sec": sum(
+                1 / getattr(e.widget, "update_interval", e.interval)
+                for e in self._entries.values()
+            ),
+            "baseline_draws_per_sec": self.changes / elapsed,
+            "baseline_bar_draws_per_sec": self.width_changes / elapsed,
+            "wakeups_per_sec": self.wakeups / elapsed,
+            "draws_per_sec": (self.draws + self.widget_draws) / elapsed,
+            "bar_draws_per_sec": self.draws / elapsed,
+            "polls_per_sec": self.polls / elapsed,
+        }
+
+
+# Module level so it survives config reloads; config.py hands widgets to it.
+scheduler = Scheduler()
@@ -0,0 +1,430 @@
+"""Startup profiling and deferred widget construction.
+
+Call ``profiler.start()`` at the top of config.py and
+``profiler.config_loaded(screens)`` at the bottom. From qtile's start until
+the bars have drawn, the profiler times:
+
+* every module the config imports (self time, nested imports excluded),
+* every widget constructor,
+* every widget's ``_configure``, where e.g. ``Image`` decodes its file,
+* every hook function the config subscribed.
+
+The report goes to the log and to ``startup_profile.json`` in the qtile
+cache dir. It includes the time to first frame, measured both from the
+start of the config and from the start of the qtile process.
+
+``LazyWidget(cls, **config)`` holds a widget's place in the bar with zero
+width. The real widget is built and configured just after the first frame,
+so expensive widgets don't delay it.
+"""
+
+import asyncio
+import functools
+import json
+import os
+import shutil
+import sys
+import time
+
+from libqtile import hook, utils
+from libqtile.log_utils import logger
+from libqtile.widget import base
+
+
+def guess_terminal(preference=None):
+    """``libqtile.utils.guess_terminal``, remembered in the qtile cache dir.
+
+    The cached answer is used while ``$PATH`` is the same and the terminal is
+    still executable, so a normal start doesn't probe twenty names on $PATH.
+    """
+    cache_file = os.path.join(utils.get_cache_dir(), "terminal.json")
+    key = [preference, os.environ.get("PATH", "")]
+    try:
+        with open(cache_file) as f:
+            cached = json.load(f)
+        if cached["key"] == key and os.access(cached["path"], os.X_OK):
+            return cached["terminal"]
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    terminal = utils.guess_terminal(preference)
+    if terminal:
+        try:
+            with open(cache_file, "w") as f:
+                json.dump({"key": key, "terminal": terminal, "path": shutil.which(terminal)}, f)
+        except OSError:
+            pass
+    return terminal
+
+
+def _process_age():
+    """Seconds since this process started, from /proc/self/stat."""
+    try:
+        with open("/proc/self/stat") as f:
+            # Field 22 (starttime); the command name in field 2 may hold spaces.
+            fields = f.read().rsplit(")", 1)[1].split()
+        started = int(fields[19]) / os.sysconf("SC_CLK_TCK")
+        return time.clock_gettime(time.CLOCK_BOOTTIME) - started
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+class _TimedLoader:
+    def __init__(self, loader, timer):
+        self._loader = loader
+        self._timer = timer
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        stack = self._timer.stack
+        stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            self._loader.exec_module(module)
+        finally:
+            total = time.perf_counter() - start
+            children = stack.pop()
+            if stack:
+                stack[-1] += total
+            self._timer.record("import", module.__name__, total - children)
+            # Don't leave the wrapper behind in the module.
+            module.__loader__ = self._loader
+            if module.__spec__ is not None:
+                module.__spec__.loader = self._loader
+
+
+class _ImportTimer:
+    """``sys.meta_path`` entry that times module execution of the real loaders."""
+
+    def __init__(self, record):
+        self.record = record
+        self.stack = []
+
+    def find_spec(self, name, path=None, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(name, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+        if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+            spec.loader = _TimedLoader(spec.loader, self)
+        return spec
+
+
+class StartupProfiler:
+    def __init__(self, report_file=None, timeout=30):
+        self.report_file = report_file
+        self.timeout = timeout
+        self.records = []
+        self.waiting = False
+        self.pending = []
+        self._started = None
+        self._marks = {}
+        self._import_timer = None
+        self._inits = {}
+        self._hooks = {}
+        self._bars = []
+        self._finish_handle = None
+        self._done = False
+
+    def record(self, kind, name, seconds):
+        self.records.append((kind, name, seconds))
+
+    def _mark(self, name):
+        self._marks[name] = time.perf_counter() - self._started
+
+    # -- config time ---------------------------------------------------------
+
+    def start(self):
+        """Start timing imports and widget constructors; top of config.py.
+
+        Only the first load of the config is profiled, not reloads.
+        """
+        if self._started is not None or self._done:
+            return
+        self.records = []
+        self._marks = {}
+        self.pending = []
+        self._started = time.perf_counter()
+        self._import_timer = _ImportTimer(self.record)
+        sys.meta_path.insert(0, self._import_timer)
+        # Time the constructors of widget classes that exist now, and of any
+        # defined while the config loads.
+        classes = base._Widget.__subclasses__()
+        while classes:
+            cls = classes.pop()
+            classes.extend(cls.__subclasses__())
+            self._wrap_init(cls)
+        base._Widget.__init_subclass__ = classmethod(self._wrap_init)
+
+    def _wrap_init(self, cls):
+        if cls in self._inits:
+            return
+        self._inits[cls] = cls.__dict__.get("__init__")
+        init = cls.__init__
+
+        @functools.wraps(init)
+        def timed_init(widget, *args, **kwargs):
+            # Subclasses calling up to us via super() are timed by their own
+            # wrapper.
+            if type(widget) is not cls:
+                return init(widget, *args, **kwargs)
+            start = time.perf_counter()
+            try:
+                init(widget, *args, **kwargs)
+            finally:
+                name = getattr(widget, "name", cls.__name__)
+                self.record("widget", name, time.perf_counter() - start)
+
+        cls.__init__ = timed_init
+
+    def _stop_config_timers(self):
+        if self._import_timer in sys.meta_path:
+            sys.meta_path.remove(self._import_timer)
+        self._import_timer = None
+        if "__init_subclass__" in base._Widget.__dict__:
+            del base._Widget.__init_subclass__
+        for cls, init in self._inits.items():
+            if init is None:
+                del cls.__init__
+            else:
+                cls.__init__ = init
+        self._inits = {}
+
+    def config_loaded(self, screens):
+        """Stop timing constructors and start timing hooks and bars; end of config.py."""
+        if self._started is None:
+            return
+        self._stop_config_timers()
+        self._mark("config")
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Not running under qtile, e.g. ``qtile check``.
+            self.finish()
+            return
+
+        for event, funcs in hook.subscriptions.items():
+            for i, func in enumerate(funcs):
+                if not asyncio.iscoroutinefunction(func):
+                    funcs[i] = self._timed_hook(event, func)
+        for screen in screens:
+            for position in ("top", "bottom", "left", "right"):
+                bar = getattr(screen, position)
+                if bar is not None and hasattr(bar, "widgets"):
+                    bar._configure_widget = self._timed_configure(bar._configure_widget)
+                    bar._actual_draw = self._timed_frame(bar, bar._actual_draw)
+                    self._bars.append(bar)
+        self.waiting = True
+        self._finish_handle = loop.call_later(self.timeout, self.finish)
+
+    def _timed_hook(self, event, func):
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                name = getattr(func, "__qualname__", repr(func))
+                self.record("hook", "{}: {}".format(event, name), time.perf_counter() - start)
+
+        if hasattr(func, "__self__"):
+            timed.__self__ = func.__self__
+        self._hooks[id(timed)] = func
+        return timed
+
+    def _timed_configure(self, configure):
+        def timed(widget):
+            start = time.perf_counter()
+            try:
+                return configure(widget)
+            finally:
+                self.record("configure", widget.name, time.perf_counter() - start)
+
+        return timed
+
+    def _timed_frame(self, bar, draw):
+        def timed():
+            start = time.perf_counter()
+            draw()
+            self.record("frame", bar.position, time.perf_counter() - start)
+            if "first_frame" not in self._marks:
+                self._mark("first_frame")
+                self._marks["first_frame_since_process"] = _process_age()
+                bar.qtile.call_soon(self.materialize)
+            elif "lazy" in self._marks:
+                self.finish()
+
+        return timed
+
+    # -- after the first frame -----------------------------------------------
+
+    def materialize(self):
+        """Build every ``LazyWidget`` waiting for the first frame.
+
+        The profile is finished on the next frame, or now if nothing changed.
+        """
+        if not self._build_pending():
+            self.finish()
+
+    def _build_pending(self):
+        self.waiting = False
+        pending, self.pending = self.pending, []
+        bars = []
+        for placeholder in pending:
+            bar = placeholder.bar
+            if placeholder.materialize(draw=False) and bar not in bars:
+                bars.append(bar)
+        self._mark("lazy")
+        for bar in bars:
+            bar.draw()
+        return bars
+
+    def finish(self):
+        """Undo all wrapping and write the report."""
+        if self._started is None:
+            return
+        self._stop_config_timers()
+        if self.waiting:
+            self._build_pending()
+        if self._finish_handle is not None:
+            self._finish_handle.cancel()
+            self._finish_handle = None
+        for funcs in hook.subscriptions.values():
+            for i, func in enumerate(funcs):
+                funcs[i] = self._hooks.get(id(func), func)
+        self._hooks = {}
+        for bar in self._bars:
+            bar.__dict__.pop("_configure_widget", None)
+            bar.__dict__.pop("_actual_draw", None)
+        self._bars = []
+        self._started = None
+        self._done = True
+
+        for line in self.report():
+            logger.info("startup: %s", line)
+        report_file = self.report_file or os.path.join(
+            utils.get_cache_dir(), "startup_profile.json"
+        )
+        try:
+            with open(report_file, "w") as f:
+                json.dump(self.summary(), f, indent=2)
+        except OSError:
+            logger.exception("startup: cannot write %s", report_file)
+
+    # -- reporting -----------------------------------------------------------
+
+    def summary(self):
+        totals = {}
+        for kind, _, seconds in self.records:
+            total = totals.setdefault(kind, {"count": 0, "ms": 0.0})
+            total["count"] += 1
+            total["ms"] += seconds * 1000
+        for total in totals.values():
+            total["ms"] = round(total["ms"], 2)
+        marks = {
+            name + "_ms": None if value is None else round(value * 1000, 2)
+            for name, value in self._marks.items()
+        }
+        records = sorted(self.records, key=lambda r: r[2], reverse=True)
+        return dict(
+            marks,
+            totals=totals,
+            records=[
+                {"kind": kind, "name": name, "ms": round(seconds * 1000, 3)}
+                for kind, name, seconds in records
+            ],
+        )
+
+    def report(self, top=10):
+        """A few log lines: milestones, totals per kind and the slowest items."""
+        summary = self.summary()
+        lines = [
+            ", ".join(
+                "{} {}".format(name[:-3], "-" if ms is None else "{:.1f} ms".format(ms))
+                for name, ms in summary.items()
+                if name.endswith("_ms")
+            )
+        ]
+        lines.append(
+            ", ".join(
+                "{} {:.1f} ms ({})".format(kind, total["ms"], total["count"])
+                for kind, total in summary["totals"].items()
+            )
+        )
+        for r in summary["records"][:top]:
+            lines.append("{:>9} {:8.2f} ms  {}".format(r["kind"], r["ms"], r["name"]))
+        return lines
+
+
+class LazyWidget(base._Widget):
+    """Stands in for a widget until the bar has drawn once.
+
+    ``cls`` is a widget class, or the name of one in ``libqtile.widget`` so
+    that even its module import is deferred. The rest of the arguments are
+    passed to it unchanged. Until then the placeholder has zero width and is
+    registered under the real widget's name.
+    """
+
+    orientations = base.ORIENTATION_BOTH
+
+    def __init__(self, cls, **config):
+        base._Widget.__init__(self, 0, **config)
+        self.widget_class = cls
+        # What the hot reloader compares against the real widget.
+        self.widget_name = cls if isinstance(cls, str) else cls.__qualname__
+        self.name = config.get("name", self.widget_name.lower())
+        self.widget = None
+        self._deferred = []
+
+    def defer(self, callback):
+        """Call ``callback(widget)`` with the real widget before it is configured."""
+        self._deferred.append(callback)
+
+    def _configure(self, qtile, bar):
+        base._Widget._configure(self, qtile, bar)
+        if profiler.waiting:
+            profiler.pending.append(self)
+        else:
+            qtile.call_soon(self.materialize)
+
+    def draw(self):
+        pass
+
+    def materialize(self, draw=True):
+        """Swap in the real widget; returns whether the bar changed."""
+        if self.widget is not None or self not in self.bar.widgets:
+            return False
+        cls = self.widget_class
+        if isinstance(cls, str):
+            from libqtile import widget as widgets
+
+            cls = getattr(widgets, cls)
+        start = time.perf_counter()
+        widget = cls(**self._user_config)
+        profiler.record("lazy", widget.name, time.perf_counter() - start)
+        self.widget = widget
+        for callback in self._deferred:
+            callback(widget)
+
+        widgets = self.bar.widgets
+        widgets[widgets.index(self)] = widget
+        if not self.bar._configure_widget(widget):
+            widgets.remove(widget)
+        for name, registered in list(self.qtile.widgets_map.items()):
+            if registered is self:
+                self.qtile.widgets_map[name] = widget
+        self.finalize()
+        if draw:
+            self.bar.draw()
+        return True
+
+
+profiler = StartupProfiler()
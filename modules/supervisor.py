@@ -0,0 +1,207 @@
+"""Session startup supervisor.
+
+Replaces the sequential autostart.sh: services declare what they wait for,
+everything whose dependencies are ready is launched in parallel, long-running
+daemons are restarted with exponential backoff when they die, and the time
+each service took to start and become ready is recorded. ``stop`` (on qtile's
+shutdown) ends supervision so nothing is respawned while the session goes down.
+"""
+
+import asyncio
+import os
+import socket
+import time
+
+from libqtile.log_utils import logger
+
+
+def path_exists(path):
+    """Readiness check: ``path`` (e.g. a server socket) exists."""
+    return lambda: os.path.exists(path)
+
+
+def socket_listening(path):
+    """Readiness check: something accepts connections on the unix socket ``path``.
+
+    Unlike ``path_exists`` this isn't fooled by a socket file left behind by a
+    previous run.
+    """
+
+    def check():
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM | socket.SOCK_NONBLOCK)
+        try:
+            sock.connect(path)
+        except BlockingIOError:
+            # Listening, just with a full backlog.
+            return True
+        except OSError:
+            return False
+        finally:
+            sock.close()
+        return True
+
+    return check
+
+
+class Service:
+    """One thing to run at startup.
+
+    ``cmd`` is an argument list. ``after`` names services that must be ready
+    first. ``ready`` is an optional callable polled until it returns true (a
+    daemon without one counts as ready once spawned). A ``oneshot`` service is
+    ready when it exits and is never restarted; other services are restarted
+    when they exit, if ``restart`` is set.
+    """
+
+    def __init__(self, name, cmd, after=(), ready=None, oneshot=False, restart=True):
+        self.name = name
+        self.cmd = cmd
+        self.after = tuple(after)
+        self.ready = ready
+        self.oneshot = oneshot
+        self.restart = restart and not oneshot
+
+
+class Supervisor:
+    def __init__(
+        self,
+        services,
+        ready_timeout=30,
+        ready_poll=0.05,
+        backoff=1,
+        max_backoff=60,
+        stable_after=30,
+    ):
+        self.services = {s.name: s for s in services}
+        for service in services:
+            for dep in service.after:
+                if dep not in self.services:
+                    raise ValueError("{} depends on unknown service {}".format(service.name, dep))
+        self.ready_timeout = ready_timeout
+        self.ready_poll = ready_poll
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.stable_after = stable_after
+        self.processes = {}
+        self.timings = {}
+        self._ready = {}
+        self._tasks = []
+        self._t0 = None
+        self._stopping = False
+
+    def start(self):
+        """Launch everything; call from a hook while the event loop runs."""
+        self._t0 = time.monotonic()
+        self._ready = {name: asyncio.Event() for name in self.services}
+        for service in self.services.values():
+            self.timings[service.name] = {"restarts": 0}
+            self._tasks.append(asyncio.create_task(self._supervise(service)))
+        self._tasks.append(asyncio.create_task(self._report_when_ready()))
+
+    def _elapsed(self):
+        return round(time.monotonic() - self._t0, 3)
+
+    async def _spawn(self, service):
+        try:
+            return await asyncio.create_subprocess_exec(
+                *service.cmd,
+                stdin=asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.DEVNULL,
+                start_new_session=True,
+            )
+        except OSError as e:
+            logger.error("supervisor: cannot start %s: %s", service.name, e)
+            return None
+
+    async def _wait_ready(self, service, proc):
+        if service.oneshot:
+            return await proc.wait() == 0
+        if service.ready is None:
+            return True
+        deadline = time.monotonic() + self.ready_timeout
+        while time.monotonic() < deadline and proc.returncode is None:
+            if service.ready():
+                return True
+            await asyncio.sleep(self.ready_poll)
+        return False
+
+    async def _supervise(self, service):
+        for dep in service.after:
+            await self._ready[dep].wait()
+
+        timing = self.timings[service.name]
+        timing["launched"] = self._elapsed()
+        delay = self.backoff
+        while True:
+            started = time.monotonic()
+            proc = await self._spawn(service)
+            if proc is None:
+                # Don't hold up dependants on something that can't run at all.
+                self._ready[service.name].set()
+                return
+            self.processes[service.name] = proc
+
+            ok = await self._wait_ready(service, proc)
+            if not self._ready[service.name].is_set():
+                timing["ready"] = self._elapsed()
+                timing["ok"] = ok
+                if not ok:
+                    logger.warning("supervisor: %s did not become ready", service.name)
+                self._ready[service.name].set()
+            if service.oneshot:
+                timing["exit"] = proc.returncode
+                return
+
+            returncode = await proc.wait()
+            if not service.restart or self._stopping:
+                timing["exit"] = returncode
+                return
+            if time.monotonic() - started > self.stable_after:
+                delay = self.backoff
+            logger.warning(
+                "supervisor: %s exited with %s, restarting in %ss", service.name, returncode, delay
+            )
+            await asyncio.sleep(delay)
+            if self._stopping:
+                return
+            delay = min(delay * 2, self.max_backoff)
+            timing["restarts"] += 1
+
+    async def _report_when_ready(self):
+        await asyncio.gather(*(event.wait() for event in self._ready.values()))
+        logger.info("supervisor: all services ready after %ss", self._elapsed())
+        for line in self.report():
+            logger.info("supervisor: %s", line)
+
+    def report(self):
+        """One line per service with its launch and ready times (seconds after start)."""
+        lines = []
+        for name, timing in sorted(
+            self.timings.items(), key=lambda item: item[1].get("ready", float("inf"))
+        ):
+            lines.append(
+                "{:<16} launched {:>7} ready {:>7} restarts {}".format(
+                    name, timing.get("launched", "-"), timing.get("ready", "-"), timing["restarts"]
+                )
+            )
+        return lines
+
+    def stop(self, terminate=True):
+        """Stop supervising: no more restarts, and terminate the services if ``terminate``.
+
+        Use ``terminate=False`` when qtile restarts in place, so the daemons
+        keep running for the new process.
+        """
+        self._stopping = True
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        if not terminate:
+            return
+        for proc in self.processes.values():
+            if proc.returncode is None:
+                try:
+                    proc.terminate()
+                except ProcessLookupError:
+                    pass
@@ -0,0 +1,275 @@
+"""Pending-update count that never blocks the bar.
+
+``checkupdates`` syncs a throwaway copy of the pacman databases over the
+network and can take many seconds. Here it runs as an asyncio subprocess
+whose output is read line by line as it arrives. The last result is saved
+with its timestamp in the qtile cache dir, so a restart shows the count
+straight away and only re-checks once ``update_interval`` has passed since
+the saved check.
+
+A pacman hook (``pacman/qtile-checkupdates.hook``) touches ``trigger_file``
+after every transaction; an inotify watch on it re-checks right after an
+upgrade instead of up to an hour later.
+
+For offline testing point ``command`` at a fake database, e.g.
+``pacman -Qu --dbpath /tmp/fakedb`` (local/ and sync/ built by hand or with
+``repo-add``), or ``checkupdates`` with ``env={"CHECKUPDATES_DB": ...}``.
+"""
+
+import asyncio
+import json
+import os
+import shlex
+import signal
+import time
+
+from libqtile.confreader import ConfigError
+from libqtile.log_utils import logger
+from libqtile.utils import get_cache_dir
+from libqtile.widget import base
+
+from modules.inotify import IN_ATTRIB, IN_CLOSE_WRITE, IN_CREATE, IN_MOVED_TO, Inotify
+
+TRIGGER_FILE = "/var/cache/pacman/qtile-checkupdates.stamp"
+_TRIGGER_MASK = IN_CLOSE_WRITE | IN_ATTRIB | IN_CREATE | IN_MOVED_TO
+
+
+def parse_update(line):
+    """``"name 1.0-1 -> 1.1-1"`` to ``(name, old, new)``; other lines to ``(line, "", "")``."""
+    parts = line.split()
+    if len(parts) == 4 and parts[2] == "->":
+        return parts[0], parts[1], parts[3]
+    return line.strip(), "", ""
+
+
+def check_options(cls, config):
+    """Raise ConfigError for keyword arguments ``cls`` has no default for.
+
+    Widgets silently ignore unknown keywords, so a typo such as
+    ``displaay_format`` otherwise goes unnoticed.
+    """
+    known = {"name"}
+    for klass in cls.__mro__:
+        known.update(name for name, _, _ in getattr(klass, "defaults", ()))
+    unknown = sorted(set(config) - known)
+    if unknown:
+        raise ConfigError("{}: unknown option(s) {}".format(cls.__name__, ", ".join(unknown)))
+
+
+class PacmanUpdates(base._TextBox):
+    """Shows the number of pending updates, checked in the background.
+
+    The check command must print one package per line; ``checkupdates``,
+    ``pacman -Qu`` and ``paru -Qu`` all do. Unknown options and a
+    ``display_format`` without ``{updates}`` are rejected when the config
+    is loaded.
+    """
+
+    orientations = base.ORIENTATION_HORIZONTAL
+    defaults = [
+        ("command", "checkupdates", "Command printing one pending update per line."),
+        ("env", None, "Extra environment variables for ``command``."),
+        ("update_interval", 3600, "Seconds between checks."),
+        ("timeout", 300, "Seconds before a check is killed."),
+        ("display_format", "Updates: {updates}", "Display format if updates available."),
+        ("no_update_string", "", "String to display if no updates available."),
+        ("colour_no_updates", "ffffff", "Colour when there's no updates."),
+        ("colour_have_updates", "ffffff", "Colour when there are updates."),
+        ("execute", None, "Command to run on click; updates are re-checked when it exits."),
+        ("cache_file", None, "Where the last result is kept (default: in the qtile cache dir)."),
+        ("trigger_file", TRIGGER_FILE, "File touched by the pacman hook to force a re-check."),
+    ]
+
+    def __init__(self, **config):
+        check_options(PacmanUpdates, config)
+        base._TextBox.__init__(self, "", **config)
+        self.add_defaults(PacmanUpdates.defaults)
+        try:
+            self.display_format.format(updates=0)
+        except (KeyError, IndexError) as e:
+            raise ConfigError("PacmanUpdates: bad display_format: {}".format(e))
+        if self.cache_file is None:
+            self.cache_file = os.path.join(get_cache_dir(), "checkupdates.json")
+        self.updates = []
+        self.checked = None
+        self._task = None
+        self._timer = None
+        self._inotify = None
+        if self.execute:
+            self.add_callbacks({"Button1": self.cmd_execute})
+
+    def _configure(self, qtile, bar):
+        self._load_cache()
+        self.text = self._format()
+        base._TextBox._configure(self, qtile, bar)
+        self.layout.colour = self._colour()
+
+    def timer_setup(self):
+        self._watch_trigger()
+        if self.checked is None:
+            self.cmd_check()
+        else:
+            self._schedule(self.checked + self.update_interval - time.time())
+
+    # -- cache ---------------------------------------------------------------
+
+    def _load_cache(self):
+        try:
+            with open(self.cache_file) as f:
+                data = json.load(f)
+            self.updates = [tuple(u) for u in data["updates"]]
+            self.checked = float(data["checked"])
+        except (OSError, ValueError, KeyError, TypeError):
+            self.updates = []
+            self.checked = None
+
+    def _save_cache(self):
+        tmp = self.cache_file + ".tmp"
+        try:
+            with open(tmp, "w") as f:
+                json.dump({"checked": self.checked, "updates": self.updates}, f)
+            os.replace(tmp, self.cache_file)
+        except OSError:
+            logger.exception("PacmanUpdates: cannot write %s", self.cache_file)
+
+    # -- checking ------------------------------------------------------------
+
+    def _schedule(self, delay):
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = self.timeout_add(max(0, delay), self.cmd_check)
+
+    def cmd_check(self):
+        """Check for updates now (does nothing if a check is already running)."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._check())
+
+    async def _check(self):
+        env = None
+        if self.env:
+            env = dict(os.environ, **self.env)
+        updates = []
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                *shlex.split(self.command),
+                stdin=asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                env=env,
+                start_new_session=True,
+            )
+        except OSError as e:
+            logger.error("PacmanUpdates: cannot run %r: %s", self.command, e)
+            self._schedule(self.update_interval)
+            return
+
+        async def read():
+            errors = asyncio.ensure_future(proc.stderr.read())
+            async for line in proc.stdout:
+                line = line.decode(errors="replace").strip()
+                if line:
+                    updates.append(parse_update(line))
+            return await errors
+
+        try:
+            stderr = await asyncio.wait_for(read(), self.timeout)
+            await proc.wait()
+        except asyncio.TimeoutError:
+            self._kill(proc)
+            await proc.wait()
+            logger.warning("PacmanUpdates: %r timed out after %ss", self.command, self.timeout)
+            self._schedule(self.update_interval)
+            return
+        except asyncio.CancelledError:
+            self._kill(proc)
+            raise
+
+        # checkupdates exits 2 and pacman -Qu exits 1 when there is nothing to
+        # do, so the exit code alone can't tell "no updates" from a failure.
+        if not updates and stderr.strip():
+            logger.warning(
+                "PacmanUpdates: %r failed (%s): %s",
+                self.command,
+                proc.returncode,
+                stderr.decode(errors="replace").strip(),
+            )
+        else:
+            new = {u[0] for u in updates} - {u[0] for u in self.updates}
+            if new:
+                logger.info("PacmanUpdates: %d new update(s): %s", len(new), " ".join(sorted(new)))
+            self.updates = updates
+            self.checked = time.time()
+            self._save_cache()
+            self._show()
+        self._schedule(self.update_interval)
+
+    @staticmethod
+    def _kill(proc):
+        # checkupdates leaves fakeroot and pacman children holding the pipes.
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    def _format(self):
+        if self.updates:
+            return self.display_format.format(updates=len(self.updates))
+        return self.no_update_string
+
+    def _colour(self):
+        return self.colour_have_updates if self.updates else self.colour_no_updates
+
+    def _show(self):
+        self.layout.colour = self._colour()
+        self.update(self._format())
+
+    # -- pacman hook ---------------------------------------------------------
+
+    def _watch_trigger(self):
+        if not self.trigger_file or self._inotify is not None:
+            return
+        directory, self._trigger_name = os.path.split(self.trigger_file)
+        try:
+            self._inotify = Inotify(self._on_trigger)
+            self._inotify.add_watch(directory, _TRIGGER_MASK)
+            self._inotify.start()
+        except OSError:
+            if self._inotify is not None:
+                self._inotify.close()
+            self._inotify = None
+            logger.info("PacmanUpdates: not watching %s", self.trigger_file)
+
+    def _on_trigger(self, events):
+        if any(name == self._trigger_name for _, _, name in events):
+            # A transaction touches the file once at the end; give pacman a
+            # moment to release its lock before checking.
+            self._schedule(1)
+
+    # -- commands ------------------------------------------------------------
+
+    def cmd_execute(self):
+        """Run ``execute`` and re-check updates once it exits."""
+        asyncio.create_task(self._execute())
+
+    async def _execute(self):
+        try:
+            proc = await asyncio.create_subprocess_shell(self.execute)
+        except OSError as e:
+            logger.error("PacmanUpdates: cannot run %r: %s", self.execute, e)
+            return
+        await proc.wait()
+        self.cmd_check()
+
+    def cmd_updates(self):
+        """The pending updates as ``(name, old, new)`` and the time they were checked."""
+        return {"checked": self.checked, "updates": self.updates}
+
+    def finalize(self):
+        if self._timer is not None:
+            self._timer.cancel()
+        if self._task is not None:
+            self._task.cancel()
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
+        base._TextBox.finalize(self)
@@ -0,0 +1,65 @@
+import os
+
+from libqtile.log_utils import logger
+from libqtile.widget import base
+
+
+def format_uptime(seconds):
+    """Format like ``uptime --pretty`` piped through ~/.local/bin/upt, e.g. '2d 3h 5m'."""
+    minutes = int(seconds // 60)
+    days, minutes = divmod(minutes, 24 * 60)
+    hours, minutes = divmod(minutes, 60)
+    parts = []
+    if days:
+        parts.append("{}d".format(days))
+    if hours:
+        parts.append("{}h".format(hours))
+    if minutes or not parts:
+        parts.append("{}m".format(minutes))
+    return " ".join(parts)
+
+
+class Uptime(base._TextBox):
+    """Shows the system uptime without forking ``uptime``.
+
+    ``/proc/uptime`` is opened once and re-read with ``pread``. The text only
+    changes once a minute, so the next update is scheduled for the next minute
+    boundary of the uptime instead of polling.
+    """
+
+    orientations = base.ORIENTATION_HORIZONTAL
+    defaults = [
+        ("path", "/proc/uptime", "File to read the uptime in seconds from."),
+    ]
+
+    def __init__(self, **config):
+        base._TextBox.__init__(self, "", **config)
+        self.add_defaults(Uptime.defaults)
+        self._fd = None
+
+    def read(self):
+        if self._fd is None:
+            self._fd = os.open(self.path, os.O_RDONLY)
+        return float(os.pread(self._fd, 64, 0).split()[0])
+
+    def timer_setup(self):
+        try:
+            seconds = self.read()
+        except (OSError, ValueError, IndexError):
+            logger.exception("Unable to read %s", self.path)
+            # Reopen on the next try, and keep trying once a minute like the
+            # normal tick.
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+            self.timeout_add(60, self.timer_setup)
+            return
+        self.update(format_uptime(seconds))
+        # A little slack so we land just after the minute ticks over.
+        self.timeout_add(60 - seconds % 60 + 0.05, self.timer_setup)
+
+    def finalize(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+        base._TextBox.finalize(self)
@@ -0,0 +1,165 @@
+import asyncio
+import re
+
+from libqtile.log_utils import logger
+from libqtile.widget import base
+
+re_volume = re.compile(r"(\d+)%")
+
+
+class PactlVolume(base._TextBox):
+    """Volume widget driven by ``pactl subscribe`` events.
+
+    A single long-lived ``pactl subscribe`` child reports sink and server
+    changes; the volume is only re-read when one of those arrives, and the bar
+    is only redrawn when the displayed text actually changes. The widget also
+    owns the volume keys (``increase_vol``, ``decrease_vol``, ``mute``) so a
+    keypress shows up immediately instead of on the next poll.
+    """
+
+    orientations = base.ORIENTATION_HORIZONTAL
+    defaults = [
+        ("format", "Volume:{volume}", "Display format, ``{volume}`` is e.g. '50%' or 'muted'."),
+        ("sink", "@DEFAULT_SINK@", "Sink to show and control."),
+        ("step", 5, "Volume change in percent for increase_vol/decrease_vol."),
+        ("max_volume", 100, "Upper limit for increase_vol, in percent."),
+        ("pactl", "pactl", "pactl binary."),
+        (
+            "subscribe_command",
+            None,
+            "Command whose stdout emits change events, one per line. Defaults to "
+            "``pactl subscribe``; anything printing pactl-style lines works.",
+        ),
+        ("restart_delay", 2, "Seconds to wait before restarting a dead event source."),
+    ]
+
+    def __init__(self, **config):
+        base._TextBox.__init__(self, "", **config)
+        self.add_defaults(PactlVolume.defaults)
+        self.volume = None
+        self.muted = False
+        self._proc = None
+        self._reader = None
+        self._refreshing = False
+        self._refresh_again = False
+
+    async def _config_async(self):
+        self._reader = asyncio.create_task(self._watch())
+
+    def finalize(self):
+        if self._reader is not None:
+            self._reader.cancel()
+        if self._proc is not None and self._proc.returncode is None:
+            self._proc.kill()
+        base._TextBox.finalize(self)
+
+    async def _watch(self):
+        command = self.subscribe_command or [self.pactl, "subscribe"]
+        while True:
+            await self._refresh()
+            try:
+                self._proc = await asyncio.create_subprocess_exec(
+                    *command,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.DEVNULL,
+                )
+            except OSError:
+                logger.exception("Unable to start volume event source %s", command)
+                await asyncio.sleep(self.restart_delay)
+                continue
+            while True:
+                line = await self._proc.stdout.readline()
+                if not line:
+                    break
+                # The default sink changing shows up as a server event.
+                if b" sink " in line or b" server " in line:
+                    self.schedule_refresh()
+            await self._proc.wait()
+            logger.warning("Volume event source exited, restarting")
+            await asyncio.sleep(self.restart_delay)
+
+    def schedule_refresh(self):
+        if self._refreshing:
+            # Coalesce bursts of events into one extra read.
+            self._refresh_again = True
+        else:
+            asyncio.create_task(self._refresh())
+
+    async def _refresh(self):
+        self._refreshing = True
+        try:
+            while True:
+                self._refresh_again = False
+                volume = await self._pactl("get-sink-volume", self.sink)
+                mute = await self._pactl("get-sink-mute", self.sink)
+                match = re_volume.search(volume) if volume is not None else None
+                # Unknown until pactl answers again; the keys then step relatively.
+                self.volume = int(match.group(1)) if match else None
+                if mute is not None:
+                    self.muted = "yes" in mute
+                self._show()
+                if not self._refresh_again:
+                    break
+        finally:
+            self._refreshing = False
+
+    async def _pactl(self, *args):
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                self.pactl,
+                *args,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.DEVNULL,
+            )
+            stdout, _ = await proc.communicate()
+        except OSError:
+            logger.exception("Unable to run %s", self.pactl)
+            return None
+        if proc.returncode != 0:
+            return None
+        return stdout.decode()
+
+    def _show(self):
+        if self.muted:
+            volume = "muted"
+        elif self.volume is None:
+            volume = "N/A"
+        else:
+            volume = "{}%".format(self.volume)
+        self.update(self.format.format(volume=volume))
+
+    def _set(self, *args):
+        asyncio.create_task(self._pactl(*args))
+
+    def _change_vol(self, delta):
+        if self.volume is None:
+            # Don't jump to an absolute value from an unknown one; let pactl
+            # step it, like ``pamixer -i`` did. max_volume can't apply here.
+            asyncio.create_task(self._step_vol(delta))
+            return
+        self.cmd_set_vol(min(max(self.volume + delta, 0), self.max_volume))
+
+    async def _step_vol(self, delta):
+        await self._pactl("set-sink-volume", self.sink, "{:+d}%".format(delta))
+        self.schedule_refresh()
+
+    def cmd_increase_vol(self, value=None):
+        """Raise the volume by ``value`` (defaults to ``step``) percent."""
+        self._change_vol(value or self.step)
+
+    def cmd_decrease_vol(self, value=None):
+        """Lower the volume by ``value`` (defaults to ``step``) percent."""
+        self._change_vol(-(value or self.step))
+
+    def cmd_set_vol(self, volume):
+        """Set the volume to an absolute percentage."""
+        self.volume = volume
+        self._set("set-sink-volume", self.sink, "{}%".format(volume))
+        # Show the new value right away; the sink event confirms it.
+        self._show()
+
+    def cmd_mute(self):
+        """Toggle mute."""
+        self.muted = not self.muted
+        self._set("set-sink-mute", self.sink, "toggle")
+        self._show()
@@ -0,0 +1,431 @@
+"""Rotating wallpapers painted from a cache of pre-scaled images.
+
+``feh --randomize --bg-fill ~/Pictures/*`` globbed the whole directory and
+decoded and scaled a full-size photo at every login, then never changed it.
+Here:
+
+* ``ImageIndex`` lists the images in a directory once, off the event loop,
+  and keeps the list current from inotify events; picks come from a shuffled
+  bag, so every image is shown once before any repeats;
+* each pick is scaled to the size of the screen it is for on a single
+  background thread, with cairo and gdk-pixbuf like qtile's own painter, and
+  saved under ``~/.cache/qtile/wallpapers`` named after the source path, its
+  mtime and size, the output size and the mode. An edited image or a new
+  resolution is a new file; the least recently used ones are pruned;
+* ``Wallpapers`` scales the next wallpaper of every screen ahead of time and
+  only ever paints an image that is already in the cache and exactly the
+  size of its screen, so painting costs one screen-sized PNG decode whatever
+  the source. The last wallpaper is painted again straight from the cache at
+  startup.
+"""
+
+import asyncio
+import concurrent.futures
+import hashlib
+import json
+import os
+import random
+import time
+
+import cairocffi
+import cairocffi.pixbuf
+from libqtile.log_utils import logger
+from libqtile.utils import get_cache_dir
+
+from modules.inotify import (
+    IN_CLOSE_WRITE,
+    IN_DELETE,
+    IN_DELETE_SELF,
+    IN_MOVE_SELF,
+    IN_MOVED_FROM,
+    IN_MOVED_TO,
+    Inotify,
+)
+
+# IN_CREATE is left out on purpose: a copied-in image is only complete at
+# IN_CLOSE_WRITE.
+_WATCH_MASK = (
+    IN_CLOSE_WRITE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE_SELF | IN_MOVE_SELF
+)
+
+# What gdk-pixbuf can usually decode.
+EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".gif", ".tif", ".tiff", ".webp")
+
+
+def scale(source, target, width, height, mode="fill"):
+    """Decode ``source`` and write it to ``target`` as a ``width`` x ``height`` PNG.
+
+    ``fill`` covers the screen and crops the middle, ``stretch`` ignores the
+    aspect ratio. Blocking; run it off the event loop.
+    """
+    with open(source, "rb") as f:
+        image, _ = cairocffi.pixbuf.decode_to_image_surface(f.read())
+    image_w, image_h = image.get_width(), image.get_height()
+    surface = cairocffi.ImageSurface(cairocffi.FORMAT_RGB24, width, height)
+    context = cairocffi.Context(surface)
+    if mode == "stretch":
+        context.scale(width / image_w, height / image_h)
+    else:
+        ratio = max(width / image_w, height / image_h)
+        context.translate((width - image_w * ratio) / 2, (height - image_h * ratio) / 2)
+        context.scale(ratio)
+    context.set_source_surface(image)
+    context.get_source().set_filter(cairocffi.FILTER_GOOD)
+    context.paint()
+    surface.flush()
+    # Written next to the target and renamed, so a half-written file is
+    # never painted.
+    partial = target + ".part"
+    surface.write_to_png(partial)
+    os.replace(partial, target)
+    return target
+
+
+def prune(directory, keep_files, keep=()):
+    """Delete all but the ``keep_files`` most recently used images in ``directory``."""
+    try:
+        with os.scandir(directory) as entries:
+            files = [(e.stat().st_mtime, e.path) for e in entries if e.name.endswith(".png")]
+    except OSError:
+        return
+    files.sort(reverse=True)
+    for _, path in files[keep_files:]:
+        if path not in keep:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+
+class ImageIndex:
+    """The images directly inside ``directory``, kept current with inotify."""
+
+    def __init__(self, directory, extensions=EXTENSIONS):
+        self.directory = os.path.expanduser(directory)
+        self.extensions = tuple(e.lower() for e in extensions)
+        self._images = {}
+        self._bag = []
+        self._inotify = None
+        self._scanned = False
+
+    def _wanted(self, name):
+        return not name.startswith(".") and name.lower().endswith(self.extensions)
+
+    def scan(self):
+        """Full listing of the directory. Blocking; done once."""
+        images = {}
+        try:
+            with os.scandir(self.directory) as entries:
+                for entry in entries:
+                    try:
+                        if self._wanted(entry.name) and entry.is_file():
+                            images[entry.path] = None
+                    except OSError:
+                        pass
+        except OSError as e:
+            logger.warning("wallpaper: can't list %s: %s", self.directory, e)
+        self._images = images
+        self._bag = []
+        self._scanned = True
+
+    async def start(self):
+        """Watch the directory, then scan it off the event loop."""
+        if self._inotify is None:
+            try:
+                self._inotify = Inotify(self._on_events)
+                self._inotify.add_watch(self.directory, _WATCH_MASK)
+                self._inotify.start()
+            except OSError:
+                logger.warning(
+                    "wallpaper: can't watch %s, new images need a restart", self.directory
+                )
+        if not self._scanned:
+            await asyncio.get_running_loop().run_in_executor(None, self.scan)
+
+    def _on_events(self, events):
+        if not self._scanned:
+            return
+        for _, mask, name in events:
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                self._images.clear()
+                continue
+            if not name or not self._wanted(name):
+                continue
+            path = os.path.join(self.directory, name)
+            if mask & (IN_DELETE | IN_MOVED_FROM):
+                self._images.pop(path, None)
+            else:
+                self._images[path] = None
+
+    def __len__(self):
+        return len(self._images)
+
+    def __contains__(self, path):
+        return path in self._images
+
+    def pick(self, avoid=()):
+        """A random image, preferably not one in ``avoid``; None if there are none."""
+        for _ in range(len(self._images) + 1):
+            if not self._bag:
+                self._bag = list(self._images)
+                random.shuffle(self._bag)
+            if not self._bag:
+                return None
+            path = self._bag.pop()
+            if path in self._images and path not in avoid:
+                return path
+        return next(iter(self._images), None)
+
+    def close(self):
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
+
+
+class Wallpapers:
+    """Paints a new image from ``directory`` on every screen each ``interval`` seconds.
+
+    ``start()`` from a ``startup`` hook; ``next`` is meant for ``lazy.function``.
+    """
+
+    def __init__(
+        self,
+        directory="~/Pictures",
+        interval=1800,
+        mode="fill",
+        cache_dir=None,
+        cache_size=64,
+        extensions=EXTENSIONS,
+    ):
+        self.index = ImageIndex(directory, extensions)
+        self.interval = interval
+        self.mode = mode
+        self.cache_dir = cache_dir or os.path.join(get_cache_dir(), "wallpapers")
+        self.cache_size = cache_size
+        self.state_file = os.path.join(self.cache_dir, "state.json")
+        self.qtile = None
+        self.current = {}
+        self.upcoming = {}
+        self.last_paint_ms = None
+        self._executor = None
+        self._jobs = {}
+        self._tasks = {}
+        self._failed = {}
+        self._task = None
+        self._handle = None
+
+    # -- cache ---------------------------------------------------------------
+
+    def cache_path(self, source, width, height):
+        """Where ``source`` scaled for a ``width`` x ``height`` screen is cached, or None."""
+        try:
+            st = os.stat(source)
+        except OSError:
+            return None
+        size = "{}x{}".format(width, height)
+        key = "\0".join((source, str(st.st_mtime_ns), str(st.st_size), size, self.mode))
+        return os.path.join(self.cache_dir, hashlib.sha1(key.encode()).hexdigest() + ".png")
+
+    async def scaled(self, source, width, height):
+        """``source`` scaled for the screen size, from the cache or the worker; None on error."""
+        target = self.cache_path(source, width, height)
+        if target is None or self._failed.get(source) == target:
+            return None
+        if os.path.exists(target):
+            return target
+        job = self._jobs.get(target)
+        if job is None:
+            loop = asyncio.get_running_loop()
+            job = loop.run_in_executor(
+                self._executor, scale, source, target, width, height, self.mode
+            )
+            self._jobs[target] = job
+            job.add_done_callback(lambda _: self._jobs.pop(target, None))
+        try:
+            await job
+        except Exception as e:
+            logger.warning("wallpaper: can't scale %s: %s", source, e)
+            self._failed[source] = target
+            return None
+        self._prune()
+        return target
+
+    def _prune(self):
+        keep = {image for _, image in self.current.values()}
+        keep.update(image for _, image in self.upcoming.values())
+        keep.update(self._jobs)
+        asyncio.get_running_loop().run_in_executor(
+            self._executor, prune, self.cache_dir, self.cache_size, keep
+        )
+
+    # -- painting ------------------------------------------------------------
+
+    def _screens(self):
+        return {i: (s.width, s.height) for i, s in enumerate(self.qtile.screens)}
+
+    def _paint(self, i, source, image):
+        start = time.perf_counter()
+        # Already the size of the screen: no mode, nothing left to scale.
+        self.qtile.paint_screen(self.qtile.screens[i], image)
+        self.last_paint_ms = (time.perf_counter() - start) * 1000
+        self.current[i] = (source, image)
+        try:
+            # Most recently used, for prune().
+            os.utime(image)
+        except OSError:
+            pass
+        logger.debug("wallpaper: %s on screen %d in %.1f ms", source, i, self.last_paint_ms)
+
+    def _restore(self):
+        """Paint the wallpapers of the last session, if they are still cached."""
+        try:
+            with open(self.state_file) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return
+        screens = self._screens()
+        for key, entry in state.get("screens", {}).items():
+            try:
+                i = int(key)
+                source, image, size = entry["source"], entry["image"], tuple(entry["size"])
+            except (KeyError, TypeError, ValueError):
+                continue
+            if screens.get(i) == size and self.cache_path(source, *size) == image:
+                if os.path.exists(image):
+                    self._paint(i, source, image)
+
+    def _save_state(self):
+        screens = self._screens()
+        state = {
+            "screens": {
+                str(i): {"source": source, "image": image, "size": screens[i]}
+                for i, (source, image) in self.current.items()
+                if i in screens
+            }
+        }
+        try:
+            with open(self.state_file, "w") as f:
+                json.dump(state, f)
+        except OSError as e:
+            logger.warning("wallpaper: can't save state: %s", e)
+
+    # -- rotation ------------------------------------------------------------
+
+    def _spawn(self, key, coro):
+        task = asyncio.create_task(coro)
+        self._tasks[key] = task
+
+        def done(_):
+            # A newer task may have taken the key in the meantime.
+            if self._tasks.get(key) is task:
+                del self._tasks[key]
+
+        task.add_done_callback(done)
+
+    async def _prepare(self, i, size):
+        """Scale the next wallpaper for screen ``i`` so it is ready when it's due."""
+        shown = {source for source, _ in self.current.values()}
+        for _ in range(3):
+            source = self.index.pick(avoid=shown)
+            if source is None:
+                return
+            image = await self.scaled(source, *size)
+            if self._screens().get(i) != size:
+                # The screen changed while this was scaling: start over for the new size.
+                self._tasks.pop(("prepare", i), None)
+                self._prefetch()
+                return
+            if image is not None:
+                self.upcoming[i] = (source, image)
+                if i not in self.current:
+                    # Nothing on this screen yet: don't wait for the timer.
+                    del self.upcoming[i]
+                    self._paint(i, source, image)
+                    self._save_state()
+                    self._tasks.pop(("prepare", i), None)
+                    self._prefetch()
+                return
+
+    def _prefetch(self):
+        for i, size in self._screens().items():
+            if i not in self.upcoming and ("prepare", i) not in self._tasks:
+                self._spawn(("prepare", i), self._prepare(i, size))
+
+    def next(self, qtile=None):
+        """Paint the prepared wallpapers now and start preparing the ones after."""
+        if self.qtile is None:
+            return
+        painted = False
+        screens = self._screens()
+        for i, (source, image) in list(self.upcoming.items()):
+            del self.upcoming[i]
+            if i in screens and os.path.exists(image):
+                self._paint(i, source, image)
+                painted = True
+        if painted:
+            self._save_state()
+        self._prefetch()
+
+    def _rotate(self):
+        self.next()
+        self._handle = asyncio.get_running_loop().call_later(self.interval, self._rotate)
+
+    def screens_changed(self):
+        """Scale for the new screen sizes; the current wallpapers are repainted once ready.
+
+        A newly plugged in screen gets a wallpaper as soon as one is scaled for it.
+        """
+        if self.qtile is None:
+            return
+        screens = self._screens()
+        for i, (source, image) in list(self.upcoming.items()):
+            size = screens.get(i)
+            if size is None or self.cache_path(source, *size) != image:
+                del self.upcoming[i]
+        for i, (source, _) in list(self.current.items()):
+            size = screens.get(i)
+            if size is not None:
+                self._spawn(("resize", i), self._resize(i, source, size))
+        self.current = {i: c for i, c in self.current.items() if i in screens}
+        self._prefetch()
+
+    async def _resize(self, i, source, size):
+        image = await self.scaled(source, *size)
+        if image is not None and self._screens().get(i) == size:
+            self._paint(i, source, image)
+            self._save_state()
+
+    async def _start(self):
+        self._restore()
+        await self.index.start()
+        if not len(self.index):
+            logger.warning("wallpaper: no images in %s", self.index.directory)
+        self._prefetch()
+        self._handle = asyncio.get_running_loop().call_later(self.interval, self._rotate)
+
+    def start(self, qtile):
+        if self._task is not None:
+            return
+        if getattr(qtile.core, "painter", None) is None:
+            logger.warning("wallpaper: the %s backend can't paint wallpapers", qtile.core.name)
+            return
+        self.qtile = qtile
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # One thread: scaling is CPU-bound and a full-size decode can be large.
+        self._executor = concurrent.futures.ThreadPoolExecutor(1, "wallpaper")
+        self._task = asyncio.create_task(self._start())
+
+    def close(self):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        for job in [*self._tasks.values(), *self._jobs.values()]:
+            job.cancel()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        self.index.close()
+        self.qtile = None